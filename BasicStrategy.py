@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+
+import HandState
+import Observation
+from BlackjackEngine import Actions
+from DealerProbabilities import DealerProbabilities, RANKS
+from RuleSet import RuleSet
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.strategy_cache')
+# Bumped whenever the way the tables are computed changes, to invalidate the cache
+VERSION = 4
+MIN_TRUE_COUNT = -5
+MAX_TRUE_COUNT = 10
+# Shape of a table: player total, soft, dealer card, can split, can double, can surrender (the Observation order)
+TABLE_SHAPE = (HandState.MAX_HARD + 1, 2, 12, 2, 2, 2)
+
+
+def shoe_counts(number_deck, true_count=0):
+    """
+    Cards per rank of a full shoe whose Hi-Lo true count is `true_count`.
+
+    A positive count removes low cards (2 to 6) evenly, a negative count removes
+    tens and aces in the proportion of the shoe, both by true_count * number_deck cards.
+    A rank never goes below 0 cards, which the high counts of small shoes would reach.
+    """
+    counts = [16.0 * number_deck if card == 10 else 4.0 * number_deck for card in RANKS]
+    running = true_count * number_deck
+    if running > 0:
+        for card in range(2, 7):
+            counts[card - 2] -= running / 5
+    elif running < 0:
+        counts[10 - 2] += running * 4 / 5
+        counts[11 - 2] += running / 5
+    return [max(count, 0.0) for count in counts]
+
+
+def compute_table(rules, true_count=0, engine=None):
+    """
+    Computes the best action of every (player total, soft, dealer card, can split, can double, can surrender).
+
+    Returns:
+    - table: int8 array of TABLE_SHAPE holding Actions values. States that cannot happen stand.
+    """
+    engine = engine or DealerProbabilities(rules.number_deck, rules=rules)
+    table = np.full(TABLE_SHAPE, Actions.STAND.value, dtype=np.int8)
+    counts = shoe_counts(rules.number_deck, true_count)
+    for upcard in RANKS:
+        shoe = list(counts)
+        shoe[upcard - 2] = max(shoe[upcard - 2] - 1, 0)
+        shoe = tuple(shoe)
+        for soft in (0, 1):
+            for total in range(12 if soft else 4, 21):
+                hard = total - 10 if soft else total
+                for can_double in (0, 1):
+                    for can_split in (0, 1):
+                        state = HandState.encode(hard, soft, 2 if can_double else 3)
+                        pair_card = None
+                        first_hand = True
+                        if can_split:
+                            if soft and total == 12:
+                                pair_card = 11
+                            elif not soft and total % 2 == 0:
+                                pair_card = total // 2
+                            if not can_double:
+                                # A pair that cannot be doubled comes from a split without DAS: it can be
+                                # split again, and is valued as a two-card hand of a split seat
+                                state = HandState.encode(hard, soft, 2)
+                                first_hand = False
+                        values = engine.state_values(state, upcard, shoe, pair_card, first_hand)
+                        if not can_double:
+                            values.pop(Actions.DOUBLE, None)
+                        for can_surrender in (1, 0):
+                            # With the surrender first, so it can then be removed for the states without it
+                            if not can_surrender:
+                                values.pop(Actions.SURRENDER, None)
+                            best = max(values, key=values.get)
+                            table[total, soft, upcard, can_split, can_double, can_surrender] = best.value
+    return table
+
+
+class BasicStrategy:
+    """
+    Basic strategy, and optionally count deviations, as dense tables indexed by observation.
+
+    The tables are computed from the rules with DealerProbabilities and cached in
+    `cache_dir`, keyed by the rules, so later starts only load them. A decision
+    is a single array index with the first Observation.BASE_SIZE columns of the
+    observations, for one observation or a batch of them.
+    """
+
+    def __init__(self, number_deck, deviations=False, cache_dir=CACHE_DIR, rules=None):
+        self.rules = rules or RuleSet(number_deck)
+        self.number_deck = self.rules.number_deck
+        self.true_counts = np.arange(MIN_TRUE_COUNT, MAX_TRUE_COUNT + 1)
+        self.table = None
+        self.deviation_tables = None
+        path = os.path.join(cache_dir, f'basic_strategy_{self.rules_key()}.npz')
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                self.table = cached['table']
+                if 'deviation_tables' in cached:
+                    self.deviation_tables = cached['deviation_tables']
+        if self.table is None or (deviations and self.deviation_tables is None):
+            self.compute(deviations)
+            os.makedirs(cache_dir, exist_ok=True)
+            tables = {'table': self.table}
+            if self.deviation_tables is not None:
+                tables['deviation_tables'] = self.deviation_tables
+            np.savez(path, **tables)
+
+    def rules_key(self):
+        return f'v{VERSION}_{self.rules.key()}'
+
+    def compute(self, deviations):
+        engine = DealerProbabilities(self.number_deck, rules=self.rules)
+        self.table = compute_table(self.rules, 0, engine)
+        if deviations:
+            self.deviation_tables = np.stack([compute_table(self.rules, true_count, engine)
+                                              for true_count in self.true_counts])
+
+    def __call__(self, obs):
+        """
+        Returns the basic strategy action (Actions value) of each observation.
+        """
+        obs = np.asarray(obs)
+        return self.table[tuple(np.moveaxis(obs[..., :Observation.BASE_SIZE], -1, 0))]
+
+    def with_count(self, obs, true_count=None):
+        """
+        Returns the action of the deviation table of the true count for each observation.
+
+        Parameters:
+        - obs: observations, with the shoe composition if `true_count` is None.
+        - true_count: true count of each observation, clipped to [MIN_TRUE_COUNT, MAX_TRUE_COUNT].
+        """
+        obs = np.asarray(obs)
+        if true_count is None:
+            true_count = obs[..., Observation.TRUE_COUNT]
+        index = np.clip(true_count, MIN_TRUE_COUNT, MAX_TRUE_COUNT) - MIN_TRUE_COUNT
+        return self.deviation_tables[(index, *np.moveaxis(obs[..., :Observation.BASE_SIZE], -1, 0))]
+
+
+if __name__ == '__main__':
+    names = {Actions.HIT.value: 'H', Actions.STAND.value: 'S', Actions.SPLIT.value: 'P', Actions.DOUBLE.value: 'D',
+             Actions.SURRENDER.value: 'R'}
+    strategy = BasicStrategy(6)
+    for soft in (0, 1):
+        print('soft' if soft else 'hard', ' '.join(f'{card:>2}' for card in RANKS))
+        for total in range(12 if soft else 5, 21):
+            print(f'{total:>4}', '  '.join(names[strategy.table[total, soft, card, 0, 1, 0]] for card in RANKS))
+    print('pairs', ' '.join(f'{card:>2}' for card in RANKS))
+    for card in RANKS:
+        total, soft = (12, 1) if card == 11 else (2 * card, 0)
+        print(f'{card:>5}', '  '.join(names[strategy.table[total, soft, upcard, 1, 1, 0]] for upcard in RANKS))
@@ -0,0 +1,526 @@
+"""
+Benchmarks of the game, the environments and their hot paths.
+
+    python Benchmarks.py run [--output results.json] [--quick]
+    python Benchmarks.py compare baseline.json results.json [--threshold 0.1]
+
+`run` times every benchmark of BENCHMARKS for each deck count and seat count it
+depends on and writes the rates (units per second) to JSON. The import and
+cold-start benchmarks run a fresh interpreter per call, their rate being the
+inverse of the time of an import or of a start. `compare` reads two
+such files and flags the benchmarks whose best rate dropped by more than
+`threshold`, exiting with status 1 when there is a regression. A benchmark that
+raises is recorded with its error instead of a rate, and a benchmark with a rate
+in the baseline but an error in the current file is a regression. One missing
+from the current file, not run (see --only), is listed apart as missing.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+import HandState
+import Observation
+from BlackjackEngine import Actions, BlackjackEngine, play_rounds
+from RuleSet import RuleSet
+from Shoe import InfiniteShoe, Shoe
+
+DECKS = (1, 2, 6, 8)
+SEATS = (1, 4, 7)
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Modules that the rules and the engine must not import
+HEAVY_MODULES = ('gym', 'gymnasium', 'numpy')
+
+# setup(number_deck, number_seats, size) returns a callable that runs the benchmark
+# once and returns the number of units it processed, or (units, seconds) when only
+# a part of the call is timed. It returns (run, teardown) when the benchmark holds
+# resources, teardown() releasing them once the benchmark is timed.
+Benchmark = namedtuple('Benchmark', ['name', 'unit', 'setup', 'decks', 'seats'])
+
+
+def _engine(number_deck, number_seats):
+    return BlackjackEngine(RuleSet(number_deck, number_seats=number_seats), rng=random.Random(0))
+
+
+def setup_engine(number_deck, number_seats, size):
+    """
+    Headless game: full rounds of BlackjackEngine, which BlackjackGame drives, without events.
+    """
+    engine = _engine(number_deck, number_seats)
+    bets = [10] * number_seats
+
+    def run():
+        play_rounds(engine, size, bets)
+        return size * number_seats
+    return run
+
+
+def setup_engine_infinite(number_deck, number_seats, size):
+    """
+    Headless game dealt from an InfiniteShoe.
+    """
+    engine = BlackjackEngine(RuleSet(number_deck, number_seats=number_seats),
+                             shoe=InfiniteShoe(number_deck, rng=random.Random(0)))
+    bets = [10] * number_seats
+
+    def run():
+        play_rounds(engine, size, bets)
+        return size * number_seats
+    return run
+
+
+def setup_engine_history(number_deck, number_seats, size):
+    """
+    Headless game recording every hand to a HandHistoryWriter in a temporary directory.
+    """
+    import tempfile
+    from HandHistory import HandHistoryWriter
+    directory = tempfile.TemporaryDirectory()
+    history = HandHistoryWriter(os.path.join(directory.name, 'history'))
+    engine = BlackjackEngine(RuleSet(number_deck, number_seats=number_seats), rng=random.Random(0), history=history)
+    bets = [10] * number_seats
+
+    def run():
+        play_rounds(engine, size, bets)
+        history.flush()
+        return size * number_seats
+
+    def teardown():
+        history.close()
+        directory.cleanup()
+    return run, teardown
+
+
+def setup_engine_instrumented(number_deck, number_seats, size):
+    """
+    Headless game timed and counted by Instruments, for the cost of the instrumentation when it is on.
+    """
+    from Instrumentation import Instruments
+    engine = BlackjackEngine(RuleSet(number_deck, number_seats=number_seats), rng=random.Random(0),
+                             instruments=Instruments())
+    bets = [10] * number_seats
+
+    def run():
+        play_rounds(engine, size, bets)
+        return size * number_seats
+    return run
+
+
+def setup_env_step(number_deck, number_seats, size):
+    """
+    BlackjackEnv.step until the end of each episode, hitting below 17.
+    """
+    from BlakcjakcEnv import BlackjackEnv
+    env = BlackjackEnv(number_deck, rules=RuleSet(number_deck, number_seats=number_seats))
+    env.set_player_count(number_seats)
+
+    def run():
+        steps = 0
+        for _ in range(size):
+            obs = env.reset()
+            done = False
+            while not done:
+                obs, _, done, _ = env.step(Actions.HIT if obs[Observation.PLAYER_TOTAL] < 17 else Actions.STAND)
+                steps += 1
+        return steps
+    return run
+
+
+def setup_multi_parties(number_deck, number_seats, size):
+    """
+    MultiPartiesEnv around BlackjackEnv, a shoe per episode with 1 to `number_seats` players per round,
+    hitting below 17.
+    """
+    from BlakcjakcEnv import BlackjackEnv
+    from MultiPartiesEnv import MultiPartiesEnv
+    env = MultiPartiesEnv(BlackjackEnv(number_deck, rules=RuleSet(number_deck, number_seats=number_seats)), seed=0)
+
+    def run():
+        steps = 0
+        for _ in range(size):
+            obs = env.reset()
+            done = False
+            while not done:
+                obs, _, done, _ = env.step(Actions.HIT if obs[Observation.PLAYER_TOTAL] < 17 else Actions.STAND)
+                steps += 1
+        return steps
+    return run
+
+
+def setup_vector_env(number_deck, number_seats, size):
+    """
+    VectorBlackjackEnv.step on 1024 rows, hitting below 17; the unit is a finished round.
+    """
+    import numpy as np
+    from VectorBlackjackEnv import VectorBlackjackEnv
+    env = VectorBlackjackEnv(number_deck, 1024, seed=0)
+    obs = env.reset()
+
+    def run():
+        nonlocal obs
+        rounds = 0
+        for _ in range(size):
+            actions = np.where(obs[:, Observation.PLAYER_TOTAL] < 17, Actions.HIT.value, Actions.STAND.value)
+            obs, _, done, _ = env.step(actions)
+            rounds += int(done.sum())
+        return rounds
+    return run
+
+
+def setup_shuffle(number_deck, number_seats, size):
+    """
+    Shuffling a shoe and dealing it down to the cut card, the shuffle being done as the cards are drawn.
+    """
+    shoe = Shoe(number_deck, rng=random.Random(0))
+    draw = shoe.draw
+
+    def run():
+        for _ in range(size):
+            shoe.shuffle()
+            while not shoe.needs_shuffle:
+                draw()
+        return size
+    return run
+
+
+def setup_deal(number_deck, number_seats, size):
+    engine = _engine(number_deck, number_seats)
+    bets = [10] * number_seats
+
+    def run():
+        shoe = engine.shoe
+        for _ in range(size):
+            if shoe.needs_shuffle:
+                shoe.shuffle()
+            engine.deal(bets)
+        return size
+    return run
+
+
+def setup_value_hands(number_deck, number_seats, size):
+    rng = random.Random(0)
+    shoe = InfiniteShoe(number_deck, rng=rng)
+    hands = [[shoe.draw() for _ in range(rng.randint(2, 5))] for _ in range(1000)]
+    value_hands = HandState.value_hands
+
+    def run():
+        for _ in range(size // len(hands)):
+            for hand in hands:
+                value_hands(hand)
+        return size // len(hands) * len(hands)
+    return run
+
+
+def setup_dealer_play(number_deck, number_seats, size):
+    engine = _engine(number_deck, number_seats)
+    shoe = engine.shoe
+
+    def run():
+        for _ in range(size):
+            if shoe.needs_shuffle:
+                shoe.shuffle()
+            engine.dealer = [engine.draw(), engine.draw()]
+            engine.play_dealer_hand()
+        return size
+    return run
+
+
+def setup_settlement(number_deck, number_seats, size):
+    """
+    BlackjackEngine.settle_round alone (dealer play included), after rounds where every player stands.
+    """
+    engine = _engine(number_deck, number_seats)
+    bets = [10] * number_seats
+    perf_counter = time.perf_counter
+
+    def run():
+        elapsed = 0.0
+        for _ in range(size):
+            engine.deal(bets)
+            while engine.playing:
+                engine.next_hand()
+            start = perf_counter()
+            engine.settle_round()
+            elapsed += perf_counter() - start
+        return size * number_seats, elapsed
+    return run
+
+
+def setup_env_settlement(number_deck, number_seats, size):
+    """
+    BlackjackEnv.settle alone, every seat standing on its first two cards.
+    """
+    from BlakcjakcEnv import BlackjackEnv
+    env = BlackjackEnv(number_deck, rules=RuleSet(number_deck, number_seats=number_seats))
+    env.set_player_count(number_seats)
+    perf_counter = time.perf_counter
+
+    def run():
+        elapsed = 0.0
+        for _ in range(size):
+            env.reset()
+            dealer_value = env.play_dealer_hand()
+            start = perf_counter()
+            env.settle(dealer_value)
+            elapsed += perf_counter() - start
+        return size * number_seats, elapsed
+    return run
+
+
+def setup_player_vs_dealer(number_deck, number_seats, size):
+    from BlakcjakcEnv import BlackjackEnv
+    env = BlackjackEnv(number_deck)
+    rng = random.Random(0)
+    values = [(rng.randint(4, 26), rng.randint(17, 26)) for _ in range(1000)]
+
+    def run():
+        for _ in range(size // len(values)):
+            for player_value, dealer_value in values:
+                env.player_vs_dealer(0, player_value, dealer_value)
+        return size // len(values) * len(values)
+    return run
+
+
+def _python(code):
+    """
+    Runs `code` in a fresh interpreter from the repository directory and returns its output.
+    """
+    process = subprocess.run([sys.executable, '-c', code], cwd=DIRECTORY, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    return process.stdout
+
+
+def _setup_import(module, forbidden=()):
+    """
+    Returns a run timing the import of `module` in a fresh interpreter, which fails if it
+    imported one of the `forbidden` modules.
+    """
+    code = (f'import sys, time\n'
+            f'start = time.perf_counter()\n'
+            f'import {module}\n'
+            f'elapsed = time.perf_counter() - start\n'
+            f'heavy = [name for name in {forbidden!r} if name in sys.modules]\n'
+            f'if heavy:\n'
+            f'    sys.exit("{module} imported " + ", ".join(heavy))\n'
+            f'print(elapsed)\n')
+
+    def run():
+        return 1, float(_python(code))
+    return run
+
+
+def setup_import_engine(number_deck, number_seats, size):
+    """
+    Import of BlackjackEngine, with the rules and the shoe, which must not load gym nor numpy.
+    """
+    return _setup_import('BlackjackEngine', HEAVY_MODULES)
+
+
+def setup_import_env(number_deck, number_seats, size):
+    """
+    Import of BlackjackEnv, with gym and numpy.
+    """
+    return _setup_import('BlakcjakcEnv')
+
+
+def setup_import_simulation(number_deck, number_seats, size):
+    """
+    Import of SimulationRunner and VectorBlackjackEnv by a simulation worker, which must not load gym.
+    """
+    return _setup_import('SimulationRunner', HEAVY_MODULES[:2])
+
+
+def setup_cold_start(number_deck, number_seats, size):
+    """
+    Whole process playing a round of BlackjackEngine: interpreter start, imports, shoe and deal.
+    """
+    code = ('import random\n'
+            'from BlackjackEngine import BlackjackEngine, play_rounds\n'
+            'from RuleSet import RuleSet\n'
+            f'play_rounds(BlackjackEngine(RuleSet({number_deck}, number_seats={number_seats})), 1, '
+            f'[10] * {number_seats})\n')
+
+    def run():
+        _python(code)
+        return 1
+    return run
+
+
+def setup_cold_start_env(number_deck, number_seats, size):
+    """
+    Whole process building a BlackjackEnv and playing a step.
+    """
+    code = ('from BlakcjakcEnv import BlackjackEnv\n'
+            f'env = BlackjackEnv({number_deck})\n'
+            'env.reset()\n'
+            'env.step(1)\n')
+
+    def run():
+        _python(code)
+        return 1
+    return run
+
+
+BENCHMARKS = [
+    Benchmark('engine', 'hands', setup_engine, DECKS, SEATS),
+    Benchmark('engine_infinite', 'hands', setup_engine_infinite, (8,), SEATS),
+    Benchmark('engine_history', 'hands', setup_engine_history, (6,), SEATS),
+    Benchmark('engine_instrumented', 'hands', setup_engine_instrumented, (6,), SEATS),
+    Benchmark('env_step', 'steps', setup_env_step, DECKS, SEATS),
+    Benchmark('multi_parties', 'steps', setup_multi_parties, DECKS, SEATS),
+    Benchmark('vector_env', 'hands', setup_vector_env, DECKS, (1,)),
+    Benchmark('shuffle', 'shoes', setup_shuffle, DECKS, (1,)),
+    Benchmark('deal', 'rounds', setup_deal, DECKS, SEATS),
+    Benchmark('value_hands', 'hands', setup_value_hands, (6,), (1,)),
+    Benchmark('dealer_play', 'hands', setup_dealer_play, DECKS, (1,)),
+    Benchmark('settlement', 'hands', setup_settlement, DECKS, SEATS),
+    Benchmark('env_settlement', 'hands', setup_env_settlement, (6,), SEATS),
+    Benchmark('player_vs_dealer', 'hands', setup_player_vs_dealer, (6,), (1,)),
+    Benchmark('import_engine', 'imports', setup_import_engine, (6,), (1,)),
+    Benchmark('import_env', 'imports', setup_import_env, (6,), (1,)),
+    Benchmark('import_simulation', 'imports', setup_import_simulation, (6,), (1,)),
+    Benchmark('cold_start', 'starts', setup_cold_start, (6,), (1,)),
+    Benchmark('cold_start_env', 'starts', setup_cold_start_env, (6,), (1,)),
+]
+# Units processed by one timed call of each benchmark
+SIZES = {'engine': 2000, 'engine_infinite': 2000, 'engine_history': 2000, 'engine_instrumented': 2000,
+         'env_step': 500, 'multi_parties': 20, 'vector_env': 50, 'shuffle': 20, 'deal': 5000, 'value_hands': 100000,
+         'dealer_play': 20000, 'settlement': 5000, 'env_settlement': 5000, 'player_vs_dealer': 100000,
+         'import_engine': 1, 'import_env': 1, 'import_simulation': 1, 'cold_start': 1, 'cold_start_env': 1}
+
+
+def time_benchmark(benchmark, number_deck, number_seats, size, repeat):
+    """
+    Times `repeat` calls of a benchmark after one warm-up call.
+
+    Returns:
+    - result: dict with the best and median rates in units per second, or the error raised.
+    """
+    teardown = None
+    try:
+        run = benchmark.setup(number_deck, number_seats, size)
+        if isinstance(run, tuple):
+            run, teardown = run
+        run()
+        rates = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            units = run()
+            elapsed = time.perf_counter() - start
+            if isinstance(units, tuple):
+                units, elapsed = units
+            rates.append(units / elapsed)
+    except Exception as error:
+        return {'error': f'{type(error).__name__}: {error}'}
+    finally:
+        if teardown is not None:
+            teardown()
+    return {'unit': benchmark.unit, 'rate': max(rates), 'median': statistics.median(rates), 'repeat': repeat,
+            'params': {'number_deck': number_deck, 'number_seats': number_seats}}
+
+
+def run_benchmarks(quick=False, selected=None, log=print):
+    """
+    Runs the benchmarks, all of them or those whose name is in `selected`.
+
+    Returns:
+    - report: dict with the environment of the run and a result per benchmark and parameters.
+    """
+    repeat = 3 if quick else 7
+    results = {}
+    for benchmark in BENCHMARKS:
+        if selected and benchmark.name not in selected:
+            continue
+        size = max(SIZES[benchmark.name] // (10 if quick else 1), 1)
+        for number_deck in benchmark.decks:
+            for number_seats in benchmark.seats:
+                key = f'{benchmark.name}[decks={number_deck},seats={number_seats}]'
+                results[key] = result = time_benchmark(benchmark, number_deck, number_seats, size, repeat)
+                if log is not None:
+                    log(f'{key}: ' + (result['error'] if 'error' in result
+                                      else f'{result["rate"]:,.0f} {result["unit"]}/s'
+                                      + (f' ({1000 / result["rate"]:.1f} ms each)' if result['rate'] < 1000 else '')))
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares the best rates of two reports.
+
+    Returns:
+    - rows: list of (name, baseline rate, current rate, ratio, regressed) for the benchmarks
+      with a rate in the baseline and a result in the current report, regressed being True
+      when the rate dropped by more than `threshold`. A benchmark that raised in the current
+      report has None as its rate and ratio and is regressed.
+    - missing: names of the benchmarks with a rate in the baseline and no result in the
+      current report, not run.
+    """
+    rows, missing = [], []
+    for name, base in baseline['results'].items():
+        if 'rate' not in base:
+            continue
+        result = current['results'].get(name)
+        if result is None:
+            missing.append(name)
+        elif 'rate' not in result:
+            rows.append((name, base['rate'], None, None, True))
+        else:
+            ratio = result['rate'] / base['rate']
+            rows.append((name, base['rate'], result['rate'], ratio, ratio < 1 - threshold))
+    return rows, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks and write the results to JSON')
+    run_parser.add_argument('--output', default='benchmarks.json')
+    run_parser.add_argument('--quick', action='store_true', help='smaller sizes and fewer repeats')
+    run_parser.add_argument('--only', nargs='*', help='names of the benchmarks to run')
+    compare_parser = commands.add_parser('compare', help='flag the regressions against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative slowdown flagged as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_benchmarks(args.quick, args.only)
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'results written to {args.output}')
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    rows, missing = compare(baseline, current, args.threshold)
+    for name, base_rate, rate, ratio, regressed in rows:
+        if rate is None:
+            print(f'{name:<45} {base_rate:>14,.0f}  REGRESSION: {current["results"][name]["error"]}')
+            continue
+        print(f'{name:<45} {base_rate:>14,.0f} {rate:>14,.0f} {ratio:>6.2f}x{"  REGRESSION" if regressed else ""}')
+    for name in missing:
+        print(f'{name:<45} missing')
+    regressions = sum(row[-1] for row in rows)
+    print(f'{regressions} regression(s) out of {len(rows)} benchmarks, {len(missing)} missing')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
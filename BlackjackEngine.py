@@ -0,0 +1,315 @@
+import random
+from collections import namedtuple
+from enum import Enum
+
+import HandState
+import Instrumentation
+from RuleSet import RuleSet
+from Shoe import Shoe
+
+
+class Actions(Enum):
+    HIT = 0
+    STAND = 1
+    SPLIT = 2
+    DOUBLE = 3
+    SURRENDER = 4
+
+
+# kind: 'deal', 'blackjack', 'hit', 'stand', 'bust', 'twenty_one', 'split', 'double', 'surrender',
+# 'invalid', 'dealer_stand', 'dealer_bust', 'result' or 'shuffle'. player and hand are None for
+# the dealer and the shoe, cards is the hand concerned and amount the gain of a result.
+Event = namedtuple('Event', ['kind', 'player', 'hand', 'cards', 'value', 'amount'])
+
+
+class BlackjackEngine:
+    """
+    Rules of a blackjack table without any input or output.
+
+    A round is played with `deal`, then `apply_action` for the hand playing until
+    `playing` is False, then `settle_round`. The methods return their results, and
+    the events of the round are only built when a `sink` callable is given, so a
+    headless engine pays nothing for them.
+
+    The table follows a RuleSet. A pair can be split (each new hand receives a
+    card straight away) up to `max_splits` times per seat, a double is allowed on
+    the first two cards of a hand and doubles its bet, the surrender is an early
+    surrender (settled before the dealer's blackjack), a hand ends when it reaches
+    21 or busts, and a natural blackjack is not played. The shoe is shuffled at
+    the end of the round once the cut card is reached. The code paths that depend
+    on the rules are chosen once here, not on every hand. A `shoe` such as an
+    InfiniteShoe can replace the Shoe built from the rules, a `history`
+    (HandHistoryWriter) records every hand settled, and `instruments`
+    (Instrumentation.Instruments, Instrumentation.DEFAULT by default) time the
+    phases of the rounds and count the actions.
+    """
+
+    def __init__(self, rules=RuleSet(), sink=None, rng=None, shoe=None, history=None, instruments=None):
+        self.rules = rules
+        self.number_deck = rules.number_deck
+        self.number_seats = rules.number_seats
+        self.sink = sink
+        self.history = history
+        self.shoe = Shoe(rules.number_deck, rules.penetration, rng) if shoe is None else shoe
+        self.draw = self.shoe.draw
+        self.dealer_hits = HandState.DEALER_HITS[rules.hit_soft_17]
+        self.can_double = self.can_double_any if rules.double_after_split else self.can_double_before_split
+        self.can_surrender = self.can_surrender_first_hand if rules.surrender else self.cannot_surrender
+        self.dealer = []
+        self.hands = []
+        self.bets = []
+        self.surrendered = []
+        # Actions played on each hand and first shoe position of the round, kept for the history
+        self.actions = []
+        self.round_start = 0
+        self.player = 0
+        self.hand_index = 0
+        if self.sink is not None:
+            self.emit('shuffle')
+        self.instruments = Instrumentation.DEFAULT if instruments is None else instruments
+        if self.instruments is not None:
+            Instrumentation.instrument_engine(self, self.instruments)
+
+    def emit(self, kind, player=None, hand=None, cards=None, value=None, amount=None):
+        self.sink(Event(kind, player, hand, cards, value, amount))
+
+    def shuffle(self):
+        self.shoe.shuffle()
+        if self.sink is not None:
+            self.emit('shuffle')
+
+    @property
+    def playing(self):
+        """
+        True while a player still has a hand to play.
+        """
+        return self.player < len(self.hands)
+
+    def current_hand(self):
+        return self.hands[self.player][self.hand_index]
+
+    def deal(self, bets):
+        """
+        Starts a round: the dealer and each player get two cards, dealer first.
+
+        Parameters:
+        - bets: bet of each player, one player per seat from the first seat.
+        """
+        if not 1 <= len(bets) <= self.number_seats:
+            raise ValueError(f'between 1 and {self.number_seats} players can sit at the table')
+        self.dealer = []
+        self.hands = [[[]] for _ in bets]
+        self.bets = [[bet] for bet in bets]
+        self.surrendered = [False] * len(bets)
+        self.player = 0
+        self.hand_index = 0
+        self.shoe.start_round()
+        if self.history is not None:
+            self.history.new_round()
+            self.actions = [[[]] for _ in bets]
+            self.round_start = self.shoe.cursor
+        for _ in range(2):
+            self.dealer.append(self.draw())
+            for hands in self.hands:
+                hands[0].append(self.draw())
+        if self.sink is not None:
+            for player, hands in enumerate(self.hands):
+                self.emit('deal', player, 0, hands[0], HandState.value_hands(hands[0]))
+            self.emit('deal', cards=self.dealer[:1], value=self.dealer[0])
+        self.skip_blackjacks()
+
+    def is_blackjack(self, player, hand):
+        """
+        A natural blackjack: 21 with the first two cards of a seat that did not split.
+        """
+        return len(self.hands[player]) == 1 and len(hand) == 2 and HandState.value_hands(hand) == 21
+
+    def skip_blackjacks(self):
+        while self.playing and self.is_blackjack(self.player, self.current_hand()):
+            if self.sink is not None:
+                self.emit('blackjack', self.player, 0, self.current_hand(), 21)
+            self.player += 1
+
+    def can_split(self, hand):
+        return len(hand) == 2 and hand[0] == hand[1] and len(self.hands[self.player]) <= self.rules.max_splits
+
+    def can_double_any(self, hand):
+        return len(hand) == 2
+
+    def can_double_before_split(self, hand):
+        return len(hand) == 2 and len(self.hands[self.player]) == 1
+
+    def can_surrender_first_hand(self, hand):
+        return len(hand) == 2 and len(self.hands[self.player]) == 1
+
+    def cannot_surrender(self, hand):
+        return False
+
+    def legal_actions(self):
+        hand = self.current_hand()
+        actions = [Actions.HIT, Actions.STAND]
+        if self.can_split(hand):
+            actions.append(Actions.SPLIT)
+        if self.can_double(hand):
+            actions.append(Actions.DOUBLE)
+        if self.can_surrender(hand):
+            actions.append(Actions.SURRENDER)
+        return actions
+
+    def apply_action(self, action):
+        """
+        Applies an action to the hand playing.
+
+        Parameters:
+        - action: an Actions member or its value.
+
+        Returns:
+        - valid: False if the action is not available for this hand, which is left as it is.
+        """
+        action = Actions(action)
+        player, hand_index = self.player, self.hand_index
+        hand = self.current_hand()
+
+        if action == Actions.HIT:
+            hand.append(self.draw())
+            value = HandState.value_hands(hand)
+            if self.sink is not None:
+                self.emit('hit', player, hand_index, hand, value)
+            if value >= 21:
+                if self.sink is not None:
+                    self.emit('bust' if value > 21 else 'twenty_one', player, hand_index, hand, value)
+                self.next_hand()
+
+        elif action == Actions.STAND:
+            if self.sink is not None:
+                self.emit('stand', player, hand_index, hand, HandState.value_hands(hand))
+            self.next_hand()
+
+        elif action == Actions.SPLIT and self.can_split(hand):
+            card1, card2 = hand
+            self.hands[player][hand_index] = [card1, self.draw()]
+            self.hands[player].insert(hand_index + 1, [card2, self.draw()])
+            self.bets[player].insert(hand_index + 1, self.bets[player][hand_index])
+            if self.history is not None:
+                self.actions[player].insert(hand_index + 1, [])
+            if self.sink is not None:
+                for index in (hand_index, hand_index + 1):
+                    new_hand = self.hands[player][index]
+                    self.emit('split', player, index, new_hand, HandState.value_hands(new_hand))
+
+        elif action == Actions.DOUBLE and self.can_double(hand):
+            hand.append(self.draw())
+            self.bets[player][hand_index] *= 2
+            if self.sink is not None:
+                self.emit('double', player, hand_index, hand, HandState.value_hands(hand),
+                          self.bets[player][hand_index])
+            self.next_hand()
+
+        elif action == Actions.SURRENDER and self.can_surrender(hand):
+            self.surrendered[player] = True
+            if self.sink is not None:
+                self.emit('surrender', player, hand_index, hand, HandState.value_hands(hand))
+            self.next_hand()
+
+        else:
+            if self.sink is not None:
+                self.emit('invalid', player, hand_index, hand)
+            return False
+        if self.history is not None:
+            self.actions[player][hand_index].append(action.value)
+        return True
+
+    def next_hand(self):
+        """
+        Moves to the next hand of the player, or to the next player after their last hand.
+        """
+        if self.hand_index < len(self.hands[self.player]) - 1:
+            self.hand_index += 1
+        else:
+            self.hand_index = 0
+            self.player += 1
+            self.skip_blackjacks()
+
+    def play_dealer_hand(self):
+        dealer_state = HandState.hand_state(self.dealer)
+        dealer_hits = self.dealer_hits
+        while dealer_hits[dealer_state]:
+            card = self.draw()
+            self.dealer.append(card)
+            dealer_state = HandState.add_card(dealer_state, card)
+        return HandState.TOTAL[dealer_state]
+
+    def settle_round(self):
+        """
+        Plays the dealer's hand, settles every hand and shuffles the shoe if needed.
+
+        Returns:
+        - results: list of (player, hand index, gain) for every hand of the round.
+        """
+        dealer_value = self.play_dealer_hand()
+        if self.sink is not None:
+            self.emit('dealer_bust' if dealer_value > 21 else 'dealer_stand', cards=self.dealer, value=dealer_value)
+        dealer_blackjack = len(self.dealer) == 2 and dealer_value == 21
+        results = []
+        for player, hands in enumerate(self.hands):
+            for hand_index, hand in enumerate(hands):
+                value = HandState.value_hands(hand)
+                bet = self.bets[player][hand_index]
+                blackjack = self.is_blackjack(player, hand)
+                if self.surrendered[player]:
+                    # Early surrender: half the bet is returned even against a dealer blackjack
+                    gain = -bet / 2
+                elif dealer_blackjack:
+                    # Without peek, a dealer blackjack takes every bet except a player blackjack
+                    gain = 0 if blackjack else -bet
+                elif blackjack:
+                    gain = self.rules.blackjack_payout * bet
+                elif value > 21:
+                    gain = -bet
+                elif dealer_value > 21 or value > dealer_value:
+                    gain = bet
+                elif value < dealer_value:
+                    gain = -bet
+                else:
+                    gain = 0
+                results.append((player, hand_index, gain))
+                if self.history is not None:
+                    self.history.record_hand(self.round_start, player, hand_index, hand, self.dealer,
+                                             self.actions[player][hand_index], bet, gain)
+                if self.sink is not None:
+                    self.emit('result', player, hand_index, hand, value, gain)
+        self.hands = []
+        if self.shoe.needs_shuffle:
+            self.shuffle()
+        return results
+
+
+def play_rounds(engine, rounds, bets):
+    """
+    Plays `rounds` rounds hitting below 17, for benchmarks and simulations.
+    """
+    gain = 0
+    for _ in range(rounds):
+        engine.deal(bets)
+        while engine.playing:
+            hand = engine.current_hand()
+            engine.apply_action(Actions.HIT if HandState.value_hands(hand) < 17 else Actions.STAND)
+        for _, _, hand_gain in engine.settle_round():
+            gain += hand_gain
+    return gain
+
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+    import time
+
+    # Throughput with the events disabled, collected, and formatted to a discarded stdout
+    rounds = 100000
+    for name, sink in [('events off', None), ('events collected', [].append), ('events printed', print)]:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = BlackjackEngine(RuleSet(6), sink=sink, rng=random.Random(0))
+            play_rounds(engine, rounds, [10] * 7)
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {7 * rounds / elapsed:.0f} hands/s')
@@ -1,46 +1,194 @@
-import gym 
-from gym import spaces
-from enum import Enum
 import numpy as np
 
-class Actions(Enum):
-    HIT = 0
-    STAND = 1
-    SPLIT = 2
-    DOUBLE = 3
-    
+import HandState
+import Instrumentation
+import Observation
+from BlackjackEngine import Actions
+from Counting import CountingShoe
+from GymAdapter import gym, spaces
+from RuleSet import RuleSet
+from Shoe import Shoe
+
+NEXT = HandState.NEXT
+TOTAL = np.array(HandState.TOTAL, dtype=np.int16)
+BLACKJACK = np.array(HandState.BLACKJACK, dtype=bool)
+# OUTCOME[dealer total][player total]: 1 if the player wins, -1 if they lose, 0 for a push
+OUTCOME = np.array([[-1 if player > 21 else 1 if dealer > 21 or player > dealer else 0 if player == dealer else -1
+                     for player in range(HandState.MAX_HARD + 1)]
+                    for dealer in range(HandState.MAX_HARD + 1)], dtype=np.float64)
+
+
 class BlackjackEnv(gym.Env):
-    #Changer reward method to return the gain of the agent
-    
-    def __init__(self, number_deck):
+    """
+    One round of blackjack per episode, the agent playing every hand of the table in turn.
+
+    The players are kept in a struct-of-arrays layout: one row per seat and one
+    column per possible hand of a seat (splits included), holding the HandState
+    of the hand, its first card, whether it is a pair and its bet. The arrays
+    are allocated once for the seats and splits of the rules and reused by every
+    round, and the round is settled with one lookup of all the hands in the
+    OUTCOME row of the dealer's total.
+
+    Every seat bets 1. The reward is 0 until the last hand of the round ends,
+    then the sum of the gains of the round; an action that is not available
+    leaves the hand as it is with a reward of -1. A natural blackjack is still
+    observed once and stands whatever the action, like in VectorBlackjackEnv.
+
+    A `history` (HandHistoryWriter created with the observation size) records
+    every decision and every hand settled, HandHistory.transitions rebuilding
+    the transitions of this environment from the files, and `instruments`
+    (Instrumentation.Instruments, Instrumentation.DEFAULT by default) time the
+    resets, steps, dealer play and settlements and count the actions.
+    GymAdapter.GymnasiumEnv gives it the gymnasium API.
+    """
+
+    def __init__(self, number_deck, with_counts=False, rules=None, shoe=None, history=None, instruments=None):
         super().__init__()
-        self.number_deck = number_deck
+        self.rules = rules or RuleSet(number_deck, number_seats=6)
+        self.number_deck = number_deck = self.rules.number_deck
+        self.dealer_hits = HandState.DEALER_HITS[self.rules.hit_soft_17]
+        self.can_double = self.can_double_any if self.rules.double_after_split else self.can_double_before_split
+        self.can_surrender = self.can_surrender_first_hand if self.rules.surrender else self.cannot_surrender
+        self.number_players = 1
         self.current_player_index = 0
         self.current_hand_index = 0
         self.dealer = []
-        self.number_players = 0
-        self.total_rewards = 0
-        self.hand_players = {f'player_{i}': \
-            {'hands': [], 'value': 0, 'nb_ace': 0, 'split': False,
-             'bet': 0, 'current_player': self.current_player_index == i, 'hand_playing': 0, 'reward':0, 'blackjack': False} for i in range(6)}
-        self.deck = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11] * 4 * self.number_deck 
-        self.info = {card: self.deck.count(card) for card in set(self.deck)}
-        self.len_deck = 13 * 4 * number_deck
-        self.action_space = spaces.Discrete(4)
-        self.observation_space = spaces.Box(low=0, high=31, shape=(2,), dtype=np.int32)
-        self.observation_game = {
-            "dealer": self.dealer,
-            "players": self.hand_players,
-            "info": self.info,
-            "len_deck": self.len_deck
-        }
-
-    def reset():
-        print('reset')
-        # restart a new game and shuffle the cards
-    
+        seats, max_hands = self.rules.number_seats, self.rules.max_hands
+        self.hand_state = np.zeros((seats, max_hands), dtype=np.int16)
+        self.hand_first = np.zeros((seats, max_hands), dtype=np.int16)
+        self.hand_pair = np.zeros((seats, max_hands), dtype=bool)
+        self.bet = np.zeros((seats, max_hands), dtype=np.float64)
+        self.nb_hands = np.zeros(seats, dtype=np.int16)
+        self.surrendered = np.zeros(seats, dtype=bool)
+        # Cards and actions of each hand and first shoe position of the round, kept for the history
+        self.history = history
+        self.hand_cards = []
+        self.hand_actions = []
+        self.round_start = 0
+        if shoe is None:
+            # The counts of the observation are kept up to date card by card by a CountingShoe
+            shoe = (CountingShoe if with_counts else Shoe)(number_deck, self.rules.penetration)
+        self.shoe = shoe
+        self.shoe_true_count = getattr(shoe, 'true_count', None)
+        # Live number of cards left per card value, updated by the shoe on each draw
+        self.info = self.shoe.counts
+        self.len_deck = self.shoe.len_deck
+        self.with_counts = with_counts
+        self.action_space = spaces.Discrete(len(Actions))
+        low, high = Observation.bounds(number_deck, with_counts)
+        self.observation_space = spaces.Box(low=low, high=high, dtype=np.int16)
+        # Reused by every call to _get_obs, copy it to keep an observation
+        self.obs = np.zeros(Observation.size(with_counts), dtype=np.int16)
+        self.instruments = Instrumentation.DEFAULT if instruments is None else instruments
+        if self.instruments is not None:
+            Instrumentation.instrument_env(self, self.instruments)
+
+    def seed(self, seed=None):
+        """
+        Reseeds the shoe and shuffles it (see Shoe.seed).
+        """
+        # gym's reset seeds np_random, as the environment checkers of gym and gymnasium expect
+        super().reset(seed=seed)
+        self.shoe.seed(seed)
+
+    def reset(self, seed=None, options=None):
+        """
+        Shuffles the shoe if the cut card has been reached and deals a round to `number_players` seats.
+
+        Parameters:
+        - seed: reseeds and shuffles the shoe first (see seed) when given.
+        - options: unused, for the gymnasium API.
+
+        Returns:
+        - observation: the observation of the first hand to play.
+        """
+        if seed is not None:
+            self.seed(seed)
+        if self.shoe.needs_shuffle:
+            self.shoe.shuffle()
+        self.shoe.start_round()
+        draw = self.shoe.draw
+        players = self.number_players
+        if self.history is not None:
+            self.history.new_round()
+            self.round_start = self.shoe.cursor
+            self.hand_cards = [[[] for _ in range(self.rules.max_hands)] for _ in range(players)]
+            self.hand_actions = [[[] for _ in range(self.rules.max_hands)] for _ in range(players)]
+        self.dealer = [draw()]
+        for player in range(players):
+            self.start_hand(player, 0, draw())
+        self.dealer.append(draw())
+        for player in range(players):
+            self.hit_hand(player, 0)
+        self.hand_state[:players, 1:] = HandState.EMPTY_HAND
+        self.bet[:players] = 0
+        self.bet[:players, 0] = 1
+        self.nb_hands[:players] = 1
+        self.surrendered[:players] = False
+        self.current_player_index = 0
+        self.current_hand_index = 0
+        return self._get_obs()
+
+    def set_player_count(self, number_players):
+        """
+        Sets the number of seats dealt from the next reset, the seat arrays being kept.
+        """
+        if not 1 <= number_players <= self.rules.number_seats:
+            raise ValueError(f'between 1 and {self.rules.number_seats} players can sit at the table')
+        self.number_players = number_players
+
+    def start_hand(self, player, hand, card):
+        self.hand_state[player, hand] = NEXT[HandState.EMPTY_HAND][card]
+        self.hand_first[player, hand] = card
+        self.hand_pair[player, hand] = False
+        if self.history is not None:
+            self.hand_cards[player][hand] = [card]
+
+    def hit_hand(self, player, hand):
+        """
+        Draws a card into a hand and returns its new HandState.
+        """
+        card = self.shoe.draw()
+        state = int(self.hand_state[player, hand])
+        self.hand_pair[player, hand] = state % 4 == 1 and self.hand_first[player, hand] == card
+        self.hand_state[player, hand] = state = NEXT[state][card]
+        if self.history is not None:
+            self.hand_cards[player][hand].append(card)
+        return state
+
+    def is_blackjack(self, player, hand):
+        return self.nb_hands[player] == 1 and BLACKJACK[self.hand_state[player, hand]]
+
+    def can_split(self, player, hand):
+        return self.hand_pair[player, hand] and self.nb_hands[player] <= self.rules.max_splits
+
+    def can_double_any(self, player, hand):
+        return self.hand_state[player, hand] % 4 == 2
+
+    def can_double_before_split(self, player, hand):
+        return self.hand_state[player, hand] % 4 == 2 and self.nb_hands[player] == 1
+
+    def can_surrender_first_hand(self, player, hand):
+        return self.hand_state[player, hand] % 4 == 2 and self.nb_hands[player] == 1
+
+    def cannot_surrender(self, player, hand):
+        return False
+
     def _get_obs(self):
-        return self.observation_game()
+        """
+        Writes the observation of the hand playing into `self.obs` (see Observation).
+        """
+        player, hand = self.current_player_index, self.current_hand_index
+        if player >= self.number_players or not self.dealer:
+            self.obs[:] = 0
+            return self.obs
+        counts = count = None
+        if self.with_counts:
+            counts = self.shoe.counts
+            count = self.shoe_true_count() if self.shoe_true_count is not None else None
+        return Observation.encode(self.obs, self.hand_state[player, hand], self.dealer[0],
+                                  self.can_split(player, hand), self.can_double(player, hand),
+                                  self.can_surrender(player, hand), counts, self.shoe.full_counts, count)
     
     def value_hands(self, hands):
         """
@@ -52,158 +200,158 @@ class BlackjackEnv(gym.Env):
         Returns:
         - value: value of the hand.
         """
-        value = 0
-        num_aces = 0
-        
-        for card in hands:
-            if card == 11:  
-                num_aces += 1
-                value += 11
-            else:
-                value += card
-    
-        while value > 21 and num_aces > 0:
-            value -= 10 
-            num_aces -= 1
-        
-        return value
+        return HandState.value_hands(hands)
     
     def play_dealer_hand(self):
         """
         Plays the dealer's hand according to the rules.
+
+        Returns:
+        - value: value of the dealer's hand.
         """
-        dealer_value = self.value_hands(self.dealer)
-        
-        while dealer_value < 17:
-            self.dealer.append(self.deck.pop())
-            dealer_value = self.value_hands(self.dealer)
+        dealer_state = HandState.hand_state(self.dealer)
         
-    def player_vs_dealer(self, reward, player_value, dealer_value):
+        while self.dealer_hits[dealer_state]:
+            card = self.shoe.draw()
+            self.dealer.append(card)
+            dealer_state = HandState.add_card(dealer_state, card)
+        return HandState.TOTAL[dealer_state]
+
+    def player_vs_dealer(self, reward, player_value, dealer_value, bet=1):
         """
         Determines the reward for a player based on the comparison of the player's hand value with the dealer's hand value.
         
         Parameters:
-        - reward: reward to be updated based on the comparison of the player's hand value with the dealer's hand value.
+        - reward: unused, kept for the callers passing the previous reward.
         - player_value: value of the player's hand.
         - dealer_value: value of the dealer's hand.
+        - bet: bet of the hand.
         
         Returns:
-        - reward: updated reward based on the comparison of the player's hand value with the dealer's hand value.
+        - reward: gain of the hand.
         """
-        reward = 0
         if player_value > 21:
-            reward = -self.hand_players[f'player_{self.current_player_index}']['bet']
+            return -bet
         elif dealer_value > 21 or player_value > dealer_value:
-            reward = self.hand_players[f'player_{self.current_player_index}']['bet']
+            return bet
         elif player_value == dealer_value:
-            reward = 0
+            return 0
+        return -bet
+
+    def settle(self, dealer_value):
+        """
+        Settles every hand of the round at once.
+
+        The unused hand slots have no bet, so they gain 0 without being masked.
+
+        Returns:
+        - gains: array of shape (number_players, max_hands).
+        """
+        players = self.number_players
+        bets = self.bet[:players]
+        naturals = BLACKJACK[self.hand_state[:players, 0]] & (self.nb_hands[:players] == 1)
+        if len(self.dealer) == 2 and dealer_value == 21:
+            # Without peek, a dealer blackjack takes every bet except a player blackjack
+            gains = -bets
+            gains[naturals, 0] = 0
         else:
-            reward = -self.hand_players[f'player_{self.current_player_index}']['bet']
-        return reward
-        
+            gains = bets * OUTCOME[dealer_value][TOTAL[self.hand_state[:players]]]
+            gains[naturals, 0] = self.rules.blackjack_payout * bets[naturals, 0]
+        # Early surrender: settled last, so it also holds against a dealer blackjack
+        surrendered = self.surrendered[:players]
+        gains[surrendered, 0] = -bets[surrendered, 0] / 2
+        return gains
 
-    def play_single_hand(self, action, hand):
+    def record_hands(self, gains):
+        for player in range(self.number_players):
+            for hand in range(self.nb_hands[player]):
+                self.history.record_hand(self.round_start, player, hand, self.hand_cards[player][hand], self.dealer,
+                                         self.hand_actions[player][hand], self.bet[player, hand], gains[player, hand])
+
+    def play_single_hand(self, action):
         """
-        Manages the transition to the next state for the player's current hand after an action.
+        Applies an action to the hand playing and moves to the next hand when it ends.
         
         Parameters:
-        - action: chosen action (HIT, STAND, SPLIT, etc.).
-        - hand: the current hand on which the action is applied.
+        - action: chosen action (HIT, STAND, SPLIT, etc.), an Actions member or its value.
         
         Returns:
         - observation: observed state after the action
-        - reward: reward obtained after the action
-        - done: boolean indicating if the episode is over
+        - reward: -1 for an unavailable action, the gains of the round when it ends, else 0
+        - done: boolean indicating if the round is over
         - truncated: boolean indicating if the episode was truncated
         """
-        reward = 0
-        dealer_playing = self.current_player_index == self.number_players
-        next_player = False
-
-        if not dealer_playing:
-            value = self.value_hands(hand)
-
-            if action == Actions.HIT:
-                hand.append(self.deck.pop())
-                value = self.value_hands(hand)
-                if value < 21:
-                    print("Continue with this hand, value less than 21")
-                elif value == 21:
-                    print("Value 21 reached, move to the next hand")
-                    reward = 1
-                    next_player = True
-
-            elif action == Actions.STAND:
-                print("Stand chosen, move to the next hand")
-                next_player = True
-
-            elif action == Actions.SPLIT and len(hand) == 2 and hand[0] == hand[1]:
-                if not self.hand_players[f'player_{self.current_player_index}']['split']:
-                    self.handle_split() 
-                else: 
-                    reward = -1  # Negative reward for an invalid action
-
-            elif action == Actions.DOUBLE:
-                print("Double chosen, draw a card and move to the next player")
-                hand.append(self.deck.pop())
-                reward = 1 if self.value_hands(hand) <= 21 else -1
-                next_player = True
-
-            # Move to the next hand or player as appropriate
-            self.advance_hand_or_player(next_player)
-
-            # Return the state and end information
-            return self._get_obs(), reward, False, False
+        action = Actions(action)
+        player, hand = self.current_player_index, self.current_hand_index
+        finished = True
+        if self.history is not None:
+            obs = self.obs.copy()
+
+        if self.is_blackjack(player, hand):
+            pass  # A natural blackjack stands whatever the action
+
+        elif action == Actions.HIT:
+            finished = TOTAL[self.hit_hand(player, hand)] >= 21
+
+        elif action == Actions.STAND:
+            pass
+
+        elif action == Actions.SPLIT and self.can_split(player, hand):
+            self.handle_split()
+            finished = False
+
+        elif action == Actions.DOUBLE and self.can_double(player, hand):
+            self.bet[player, hand] *= 2
+            self.hit_hand(player, hand)
+
+        elif action == Actions.SURRENDER and self.can_surrender(player, hand):
+            self.surrendered[player] = True
 
         else:
-            # Handle the dealer's turn after all players have finished
-            print("The dealer is now playing")
-            self.play_dealer_hand()
-            
-            # Calculate the rewards for each player
-            dealer_value = self.value_hands(self.dealer)
-            for i in range(self.number_players):
-                player = f'player_{i}'
-                if self.hand_players[player]['split']:
-                    for hand in self.hand_players[player]['hands']:
-                        reward = self.player_vs_dealer(reward, self.value_hands(hand), dealer_value)
-                        self.total_rewards += reward
-                else:
-                    reward = self.player_vs_dealer(reward, self.value_hands(hand), dealer_value)
-                    self.total_rewards += reward
-            return self._get_obs(), self.total_rewards, True, False  # Episode finished
-
-    def advance_hand_or_player(self, next_player):
+            if self.history is not None:
+                self.history.record_decision(player, hand, obs, action.value, False)
+            return self._get_obs(), -1, False, False  # Negative reward for an invalid action
+
+        if self.history is not None:
+            self.history.record_decision(player, hand, obs, action.value, True)
+            self.hand_actions[player][hand].append(action.value)
+        if finished:
+            self.advance_hand_or_player()
+        if self.current_player_index < self.number_players:
+            return self._get_obs(), 0, False, False
+
+        # Every hand is played: the dealer plays and the round is settled
+        gains = self.settle(self.play_dealer_hand())
+        if self.history is not None:
+            self.record_hands(gains)
+        return self._get_obs(), float(gains.sum()), True, False
+
+    def advance_hand_or_player(self):
         """
         Moves to the next hand for the current player or to the next player if all hands of the player have been played.
         """
-        if self.current_hand_index < len(self.hand_players[f'player_{self.current_player_index}']['hands']) - 1:
+        if self.current_hand_index < self.nb_hands[self.current_player_index] - 1:
             self.current_hand_index += 1  # Move to the next hand of the same player
-            print(f"Move to the next hand for player {self.current_player_index}: hand {self.current_hand_index}")
-        elif next_player:
+        else:
             self.current_hand_index = 0  # Reset the hand index for the next player
             self.current_player_index += 1
-            print(f"Move to the next player: player {self.current_player_index}")
-
 
     def handle_split(self):
         """
         Handles the case where the player chooses to split.
-        """
-        current_player = f'player_{self.current_player_index}'
-        hand = self.hand_players[current_player]['hands'][self.current_hand_index]
-        
-        # Split the hand into two new hands with additional cards
-        card1, card2 = hand
-        new_hand1 = [card1, self.deck.pop()]
-        new_hand2 = [card2, self.deck.pop()]
-        
-        # Update the list of hands to include the new hands from the split
-        self.hand_players[current_player]['hands'][self.current_hand_index] = new_hand1
-        self.hand_players[current_player]['hands'].insert(self.current_hand_index + 1, new_hand2)
-        self.hand_players[current_player]['split'] = True
-        print(f"Hand split for {current_player}: new hands {new_hand1} and {new_hand2}")
 
+        The second card starts a new hand in the next free slot of the seat, and
+        each hand receives a new card.
+        """
+        player, hand = self.current_player_index, self.current_hand_index
+        new_hand = int(self.nb_hands[player])
+        card = int(self.hand_first[player, hand])
+        self.start_hand(player, hand, card)
+        self.start_hand(player, new_hand, card)
+        self.bet[player, new_hand] = self.bet[player, hand]
+        self.nb_hands[player] += 1
+        self.hit_hand(player, hand)
+        self.hit_hand(player, new_hand)
 
     def step(self, action):        
         """
@@ -218,10 +366,7 @@ class BlackjackEnv(gym.Env):
         - done: indicates if the episode is over
         - truncated: indicates if the episode was truncated
         """
-        current_hand = self.hand_players[f'player_{self.current_player_index}']['hands'][self.current_hand_index]
-        new_state, reward, done, truncated = self.play_single_hand(action, self.value_hands(current_hand), current_hand)
-        
-        return new_state, reward, done, truncated
+        return self.play_single_hand(action)
 
         
         
@@ -0,0 +1,179 @@
+"""
+Card counting systems, a shoe keeping their counts up to date and bet spreads.
+
+A system is a list of tags indexed by card value (2 to 11, the ace being 11).
+The running count is the sum of the tags of the dealt cards; the true count
+divides it by the number of decks left, truncated to an int as in
+Observation. KO is unbalanced and is used without conversion: its betting
+count is the running count, started at KO_START per deck.
+"""
+import numpy as np
+
+from Shoe import Shoe
+
+#           0  1  2  3  4  5  6  7  8  9 10  A
+HI_LO =    [0, 0, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1]
+KO =       [0, 0, 1, 1, 1, 1, 1, 1, 0, 0, -1, -1]
+OMEGA_II = [0, 0, 1, 1, 2, 2, 2, 1, 0, -1, -2, 0]
+SYSTEMS = {'hi_lo': HI_LO, 'ko': KO, 'omega_ii': OMEGA_II}
+BALANCED = {'hi_lo': True, 'ko': False, 'omega_ii': True}
+# Initial running count of KO per deck, so that its pivot is +4
+KO_START = -4
+
+
+def initial_count(system, number_deck):
+    return 4 + KO_START * number_deck if system == 'ko' else 0
+
+
+def running_count(system, counts, full_counts):
+    """
+    Running count of `system` computed from the cards left per card value, in O(ranks),
+    without the initial count of KO.
+    """
+    tags = SYSTEMS[system]
+    return sum(tags[card] * (full_counts[card] - counts[card]) for card in range(2, 12))
+
+
+def true_count(running, cards_left):
+    """
+    Running count divided by the decks left, at least half a deck, truncated to an int.
+    """
+    return int(running / max(cards_left / 52, 0.5))
+
+
+class CountingShoe(Shoe):
+    """
+    Shoe updating the running count of every system of SYSTEMS on each draw, in O(1).
+
+    `running` maps each system to its running count, and `counts` (inherited
+    from Shoe) is the number of cards left per card value.
+    """
+
+    def __init__(self, number_deck, penetration=0.5, rng=None):
+        self.running = {}
+        super().__init__(number_deck, penetration, rng)
+
+    def shuffle(self):
+        super().shuffle()
+        for system in SYSTEMS:
+            self.running[system] = initial_count(system, self.number_deck)
+
+    def shuffle_discards(self):
+        super().shuffle_discards()
+        # The count goes on with the cards of the round, the only ones dealt from the new shoe
+        for system in SYSTEMS:
+            self.running[system] = (initial_count(system, self.number_deck)
+                                    + running_count(system, self.counts, self.full_counts))
+
+    def draw(self):
+        card = Shoe.draw(self)
+        running = self.running
+        running['hi_lo'] += HI_LO[card]
+        running['ko'] += KO[card]
+        running['omega_ii'] += OMEGA_II[card]
+        return card
+
+    def true_count(self, system='hi_lo'):
+        return true_count(self.running[system], self.len_deck - self.cursor)
+
+    def count(self, system='hi_lo'):
+        """
+        Count used to size the bets: the true count of a balanced system, the running count of KO.
+        """
+        return self.true_count(system) if BALANCED[system] else self.running[system]
+
+
+class BetSpread:
+    """
+    Bet in units as a function of the betting count of a system.
+
+    Parameters:
+    - units: bet for each count from `start` up, the last one holding for the higher counts
+      and the first one for the lower counts.
+    - start: count of the first bet of `units`.
+    - system: name of the counting system of SYSTEMS.
+    """
+
+    def __init__(self, units=(1, 2, 4, 8, 12), start=1, system='hi_lo'):
+        self.units = list(units)
+        self.start = start
+        self.system = system
+
+    def bet(self, count):
+        return self.units[min(max(count - self.start, 0), len(self.units) - 1)]
+
+    def __call__(self, env, rows):
+        """
+        Bets of the rows `rows` of a counting VectorBlackjackEnv, before their cards are dealt.
+        """
+        index = np.clip(env.betting_counts(rows, self.system) - self.start, 0, len(self.units) - 1)
+        return np.asarray(self.units, dtype=np.float32)[index]
+
+
+def simulate_bet_spread(spread, rules, shoes=1_000_000, bankroll=1000, num_envs=4096, seed=None, policy=None):
+    """
+    Plays basic strategy with a bet spread on VectorBlackjackEnv shoes, the counts being
+    updated card by card by the environment.
+
+    Every row of the environment is a player starting with `bankroll` units and
+    playing its own shoes. The risk of ruin is measured as the fraction of players
+    whose bankroll reached 0 during the simulation, and estimated for an infinite
+    horizon from the win rate and variance (exp(-2 * win rate * bankroll / variance)).
+
+    Parameters:
+    - spread: BetSpread or any callable (env, rows) -> bets.
+    - rules: RuleSet of the table.
+    - shoes: number of shoes to play, across all the rows.
+    - policy: callable from observations to actions, BasicStrategy of the rules by default.
+
+    Returns:
+    - result: dict with the rounds and shoes played, the win rate and standard deviation per
+      round, the win rate per 100 rounds, the average bet and both risks of ruin.
+    """
+    from BasicStrategy import BasicStrategy
+    from VectorBlackjackEnv import VectorBlackjackEnv
+
+    policy = policy or BasicStrategy(rules.number_deck, rules=rules)
+    env = VectorBlackjackEnv(rules.number_deck, num_envs, seed=seed, rules=rules, counting=True, bet_policy=spread)
+    obs = env.reset()
+    balance = np.full(num_envs, float(bankroll))
+    ruined = np.zeros(num_envs, dtype=bool)
+    total, total_squares, rounds, bets = 0.0, 0.0, 0, 0.0
+    start_shoes = env.shoes_played
+    while env.shoes_played - start_shoes < shoes:
+        # Wagers of the rounds in play, placed when they were dealt (doubles and splits excluded),
+        # read before step deals the next rounds of the finished rows
+        round_bets = env.initial_bet.copy()
+        obs, reward, done, _ = env.step(policy(obs))
+        gains = reward[done]
+        total += gains.sum()
+        total_squares += (gains ** 2).sum()
+        rounds += int(done.sum())
+        bets += round_bets[done].sum()
+        balance += reward
+        ruined |= balance <= 0
+    mean = total / rounds
+    variance = total_squares / rounds - mean ** 2
+    return {
+        'rounds': rounds,
+        'shoes': env.shoes_played - start_shoes,
+        'win_rate': mean,
+        'std': variance ** 0.5,
+        'win_rate_per_100': 100 * mean,
+        'average_bet': bets / rounds,
+        'risk_of_ruin_simulated': float(ruined.mean()),
+        'risk_of_ruin': float(np.exp(-2 * mean * bankroll / variance)) if mean > 0 else 1.0,
+    }
+
+
+if __name__ == '__main__':
+    from RuleSet import RuleSet
+
+    rules = RuleSet(6, penetration=0.75, blackjack_payout=1.5)
+    for name, spread in [('flat', BetSpread((1,))), ('hi-lo 1-12', BetSpread((1, 2, 4, 8, 12), start=1)),
+                         ('ko 1-12', BetSpread((1, 2, 2, 4, 4, 6, 8, 10, 12), start=-5, system='ko')),
+                         ('omega ii 1-12', BetSpread((1, 2, 2, 4, 4, 8, 8, 12), start=2, system='omega_ii'))]:
+        result = simulate_bet_spread(spread, rules, shoes=100000, bankroll=200, num_envs=1024, seed=0)
+        print(f'{name}: {result["win_rate_per_100"]:+.2f} units/100 rounds, std {result["std"]:.2f}, '
+              f'average bet {result["average_bet"]:.2f}, risk of ruin {result["risk_of_ruin"]:.3f} '
+              f'(simulated {result["risk_of_ruin_simulated"]:.3f} over {result["rounds"] // 1024} rounds)')
@@ -0,0 +1,338 @@
+import logging
+import time
+
+import numpy as np
+
+import Observation
+from BlackjackEngine import Actions
+from VectorBlackjackEnv import VectorBlackjackEnv
+
+logger = logging.getLogger(__name__)
+
+
+def legal_actions(obs):
+    """
+    Mask of the actions available in each row of `obs`: hit and stand always, split, double and
+    surrender when the observation allows them.
+    """
+    mask = np.ones((len(obs), len(Actions)), dtype=bool)
+    mask[:, Actions.SPLIT.value] = obs[:, Observation.CAN_SPLIT]
+    mask[:, Actions.DOUBLE.value] = obs[:, Observation.CAN_DOUBLE]
+    mask[:, Actions.SURRENDER.value] = obs[:, Observation.CAN_SURRENDER]
+    return mask
+
+
+class ReplayBuffer:
+    """
+    Experience replay stored in preallocated ring arrays, one array per field.
+
+    Transitions are added and sampled by batches with array indexing, so no
+    Python object is created per transition.
+    """
+
+    def __init__(self, capacity, obs_dim, obs_dtype=np.int16, rng=None):
+        self.capacity = capacity
+        self.rng = rng or np.random.default_rng()
+        self.obs = np.zeros((capacity, obs_dim), dtype=obs_dtype)
+        self.next_obs = np.zeros((capacity, obs_dim), dtype=obs_dtype)
+        self.action = np.zeros(capacity, dtype=np.int8)
+        self.reward = np.zeros(capacity, dtype=np.float32)
+        self.done = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+
+    @property
+    def nbytes(self):
+        return self.obs.nbytes + self.next_obs.nbytes + self.action.nbytes + self.reward.nbytes + self.done.nbytes
+
+    def add_batch(self, obs, action, reward, next_obs, done):
+        """
+        Adds a batch of transitions, overwriting the oldest ones once the buffer is full.
+
+        Returns:
+        - indices: positions where the transitions were written.
+        """
+        indices = (self.position + np.arange(len(action))) % self.capacity
+        self.obs[indices] = obs
+        self.next_obs[indices] = next_obs
+        self.action[indices] = action
+        self.reward[indices] = reward
+        self.done[indices] = done
+        self.position = (self.position + len(action)) % self.capacity
+        self.size = min(self.size + len(action), self.capacity)
+        return indices
+
+    def batch(self, indices):
+        return self.obs[indices], self.action[indices], self.reward[indices], self.next_obs[indices], self.done[indices]
+
+    def sample(self, batch_size):
+        """
+        Samples a batch of transitions uniformly.
+
+        Returns:
+        - indices, weights, transitions: positions of the transitions, their importance
+          weights (all ones) and the (obs, action, reward, next_obs, done) arrays.
+        """
+        indices = self.rng.integers(0, self.size, batch_size)
+        return indices, np.ones(batch_size, dtype=np.float32), self.batch(indices)
+
+    def update_priorities(self, indices, td_errors):
+        pass
+
+
+class SumTree:
+    """
+    Binary tree in an array whose nodes hold the sum of the priorities of their leaves.
+
+    The leaves are the last `size` entries of `tree`, `size` being a power of two.
+    Sampling and updates walk the tree level by level for a whole batch at once.
+    """
+
+    def __init__(self, capacity):
+        self.size = 1 << max(capacity - 1, 0).bit_length()
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, priorities):
+        nodes = indices + self.size
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """
+        Returns the leaf of each value, a leaf being chosen with probability priority / total.
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values = values - self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.size
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer sampling transitions with probability priority ** alpha (proportional variant).
+    """
+
+    def __init__(self, capacity, obs_dim, obs_dtype=np.int16, rng=None, alpha=0.6, beta=0.4, epsilon=1e-3):
+        super().__init__(capacity, obs_dim, obs_dtype, rng)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.tree.tree.nbytes
+
+    def add_batch(self, obs, action, reward, next_obs, done):
+        indices = super().add_batch(obs, action, reward, next_obs, done)
+        self.tree.update(indices, np.full(len(indices), self.max_priority))
+        return indices
+
+    def sample(self, batch_size):
+        # One value per equal segment of the total priority
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        values = np.minimum(values, self.tree.total * (1 - 1e-9))
+        indices = np.minimum(self.tree.find(values), self.size - 1)
+        probabilities = self.tree.tree[indices + self.tree.size] / self.tree.total
+        weights = (self.size * probabilities) ** -self.beta
+        return indices, (weights / weights.max()).astype(np.float32), self.batch(indices)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = (np.abs(td_errors) + self.epsilon) ** self.alpha
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities)
+
+
+class QNetwork:
+    """
+    Fully connected network with ReLU activations trained with Adam, in NumPy on the CPU.
+    """
+
+    def __init__(self, sizes, learning_rate=1e-3, rng=None):
+        rng = rng or np.random.default_rng()
+        self.weights = [rng.normal(0, np.sqrt(2 / n_in), (n_in, n_out)).astype(np.float32)
+                        for n_in, n_out in zip(sizes[:-1], sizes[1:])]
+        self.biases = [np.zeros(n_out, dtype=np.float32) for n_out in sizes[1:]]
+        self.learning_rate = learning_rate
+        self.moments = [np.zeros_like(p) for p in self.parameters()]
+        self.velocities = [np.zeros_like(p) for p in self.parameters()]
+        self.steps = 0
+
+    def parameters(self):
+        return self.weights + self.biases
+
+    @property
+    def nbytes(self):
+        return 3 * sum(p.nbytes for p in self.parameters())
+
+    def copy_from(self, other):
+        for p, q in zip(self.parameters(), other.parameters()):
+            p[...] = q
+
+    def forward(self, x):
+        """
+        Returns the Q-values of `x` and the activations needed by `backward`.
+        """
+        activations = [x]
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w + b
+            if i < len(self.weights) - 1:
+                x = np.maximum(x, 0)
+            activations.append(x)
+        return x, activations
+
+    def backward(self, activations, grad):
+        """
+        Backpropagates the gradient of the loss with respect to the output and applies an Adam step.
+        """
+        grads_w, grads_b = [], []
+        for i in reversed(range(len(self.weights))):
+            grads_w.append(activations[i].T @ grad)
+            grads_b.append(grad.sum(axis=0))
+            if i > 0:
+                grad = (grad @ self.weights[i].T) * (activations[i] > 0)
+        grads = grads_w[::-1] + grads_b[::-1]
+
+        self.steps += 1
+        beta1, beta2 = 0.9, 0.999
+        correction = np.sqrt(1 - beta2 ** self.steps) / (1 - beta1 ** self.steps)
+        for p, g, m, v in zip(self.parameters(), grads, self.moments, self.velocities):
+            m *= beta1
+            m += (1 - beta1) * g
+            v *= beta2
+            v += (1 - beta2) * g * g
+            p -= self.learning_rate * correction * m / (np.sqrt(v) + 1e-8)
+
+
+class DQN:
+    """
+    Deep Q-learning on VectorBlackjackEnv.
+
+    BlackjackEnv plays one hand per step, so the trainer uses its batched
+    counterpart, which follows the same rules: each step of the environment adds
+    `num_envs` transitions to the replay buffer, followed by `updates_per_step`
+    gradient steps on sampled batches. Both environments give the same
+    observations, so `act` plays BlackjackEnv as well, one observation per row.
+
+    The actions that an observation does not allow (split, double, surrender) are
+    masked out of the greedy choice, the exploration and the targets.
+    """
+
+    def __init__(self, number_deck=6, num_envs=256, capacity=1_000_000, batch_size=512, hidden=(64, 64),
+                 gamma=1.0, learning_rate=1e-3, target_update=500, updates_per_step=1, prioritized=False,
+                 epsilon_start=1.0, epsilon_end=0.05, epsilon_decay=20000, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.env = VectorBlackjackEnv(number_deck, num_envs, seed=self.rng)
+        obs_dim = self.env.observation_space.shape[1]
+        # Observation values are scaled to [0, 1] before entering the network
+        self.scale = 1 / self.env.observation_space.high[0].astype(np.float32)
+        buffer_class = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+        self.buffer = buffer_class(capacity, obs_dim, rng=self.rng)
+        sizes = [obs_dim, *hidden, len(Actions)]
+        self.q_network = QNetwork(sizes, learning_rate, self.rng)
+        self.target_network = QNetwork(sizes, learning_rate, self.rng)
+        self.target_network.copy_from(self.q_network)
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.target_update = target_update
+        self.updates_per_step = updates_per_step
+        self.epsilon_start = epsilon_start
+        self.epsilon_end = epsilon_end
+        self.epsilon_decay = epsilon_decay
+        self.updates = 0
+        self.obs = self.env.reset().copy()
+
+    @property
+    def epsilon(self):
+        fraction = min(self.updates / self.epsilon_decay, 1.0)
+        return self.epsilon_start + fraction * (self.epsilon_end - self.epsilon_start)
+
+    def act(self, obs, epsilon=0.0):
+        legal = legal_actions(obs)
+        q_values, _ = self.q_network.forward(obs * self.scale)
+        actions = np.where(legal, q_values, -np.inf).argmax(axis=1)
+        explore = self.rng.random(len(actions)) < epsilon
+        # A uniform draw among the legal actions of each row
+        actions[explore] = (self.rng.random((explore.sum(), len(Actions))) * legal[explore]).argmax(axis=1)
+        return actions
+
+    def update(self):
+        """
+        One gradient step on a sampled batch.
+
+        Returns:
+        - loss: mean weighted squared TD error of the batch.
+        """
+        indices, weights, (obs, action, reward, next_obs, done) = self.buffer.sample(self.batch_size)
+        next_q, _ = self.target_network.forward(next_obs * self.scale)
+        next_q = np.where(legal_actions(next_obs), next_q, -np.inf).max(axis=1)
+        target = reward + self.gamma * np.where(done, 0.0, next_q)
+        q_values, activations = self.q_network.forward(obs * self.scale)
+        rows = np.arange(len(action))
+        td_error = q_values[rows, action] - target
+        grad = np.zeros_like(q_values)
+        grad[rows, action] = weights * td_error / len(action)
+        self.q_network.backward(activations, grad)
+        self.buffer.update_priorities(indices, td_error)
+        self.updates += 1
+        if self.updates % self.target_update == 0:
+            self.target_network.copy_from(self.q_network)
+        return float(np.mean(weights * td_error ** 2))
+
+    def train(self, steps, log_every=1000):
+        """
+        Plays `steps` steps of the environment, learning from the replay buffer after each one,
+        and logs the progress every `log_every` steps (at INFO level on the DQN logger).
+
+        Returns:
+        - stats: dict with the mean reward per round, the last loss, gradient steps per second,
+          transitions per second and the memory used by the buffer and the networks.
+        """
+        start = time.perf_counter()
+        total_reward, rounds, loss = 0.0, 0, 0.0
+        for step in range(1, steps + 1):
+            actions = self.act(self.obs, self.epsilon)
+            next_obs, reward, done, _ = self.env.step(actions)
+            self.buffer.add_batch(self.obs, actions, reward, next_obs, done)
+            # The environment reuses its observation buffer
+            self.obs = next_obs.copy()
+            total_reward += reward.sum()
+            rounds += done.sum()
+            if self.buffer.size >= self.batch_size:
+                for _ in range(self.updates_per_step):
+                    loss = self.update()
+            if log_every and step % log_every == 0:
+                logger.info('step %d: reward/round %.4f, loss %.4f, epsilon %.3f',
+                            step, total_reward / max(rounds, 1), loss, self.epsilon)
+        elapsed = time.perf_counter() - start
+        return {
+            'reward_per_round': total_reward / max(rounds, 1),
+            'loss': loss,
+            'updates_per_second': steps * self.updates_per_step / elapsed,
+            'transitions_per_second': steps * self.env.num_envs / elapsed,
+            'buffer_bytes': self.buffer.nbytes,
+            'network_bytes': self.q_network.nbytes + self.target_network.nbytes,
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    agent = DQN(seed=0, prioritized=True)
+    stats = agent.train(20000, log_every=2000)
+    for key, value in stats.items():
+        print(f'{key}: {value:.4f}' if isinstance(value, float) else f'{key}: {value}')
+    print(f'bytes per transition: {agent.buffer.nbytes / agent.buffer.capacity:.1f}')
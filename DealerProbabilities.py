@@ -0,0 +1,204 @@
+from functools import lru_cache
+
+import HandState
+from BlackjackEngine import Actions
+from RuleSet import RuleSet
+
+RANKS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+# Dealer final totals, in the order of the returned distributions
+OUTCOMES = [17, 18, 19, 20, 21, 'bust', 'blackjack']
+BUST, DEALER_BLACKJACK = 5, 6
+
+
+class DealerProbabilities:
+    """
+    Exact dealer outcomes and player expected values for the composition of the shoe.
+
+    The shoe is a vector of the remaining number of cards of each rank (2 to 10 and
+    11 for an ace). Dealer distributions and player values are memoized over
+    (hand state, remaining counts) in bounded LRU caches, so queries repeated
+    during a shoe, or sharing sub-hands, are only computed once. Player values
+    draw from the composition at the decision point: the cards the player draws
+    afterwards are not removed again, which keeps a query to a single dealer
+    distribution per upcard and makes it cheap enough for every step. The rules
+    come from a RuleSet; split hands are valued without resplitting.
+    """
+
+    def __init__(self, number_deck, cache_size=2 ** 18, rules=None):
+        self.rules = rules or RuleSet(number_deck)
+        self.dealer_hits = HandState.DEALER_HITS[self.rules.hit_soft_17]
+        number_deck = self.rules.number_deck
+        self.counts = tuple(16 * number_deck if card == 10 else 4 * number_deck for card in RANKS)
+        self._dealer = lru_cache(maxsize=cache_size)(self._dealer_outcomes)
+        self._player = lru_cache(maxsize=cache_size)(self._player_best)
+
+    @classmethod
+    def from_info(cls, info, cache_size=2 ** 18, rules=None):
+        """
+        Creates the engine from counts indexed by card value, like BlackjackEnv.info.
+        """
+        engine = cls(1, cache_size, rules)
+        engine.counts = tuple(info[card] for card in RANKS)
+        return engine
+
+    def remove(self, card):
+        """
+        Removes a dealt card from the shoe.
+        """
+        counts = list(self.counts)
+        counts[card - 2] -= 1
+        self.counts = tuple(counts)
+
+    def add(self, card):
+        """
+        Puts a card back in the shoe.
+        """
+        counts = list(self.counts)
+        counts[card - 2] += 1
+        self.counts = tuple(counts)
+
+    def clear_cache(self):
+        self._dealer.cache_clear()
+        self._player.cache_clear()
+
+    def _draws(self, counts):
+        """
+        Yields (card, probability, remaining counts) for every card that can be drawn.
+
+        The counts of BasicStrategy.shoe_counts are fractional: a rank with less than one
+        card left can be drawn, with its probability, and then has none left.
+        """
+        total = sum(counts)
+        for index, count in enumerate(counts):
+            if count > 0:
+                remaining = counts[:index] + (max(count - 1, 0),) + counts[index + 1:]
+                yield RANKS[index], count / total, remaining
+
+    def _dealer_outcomes(self, state, counts):
+        if not self.dealer_hits[state]:
+            outcomes = [0.0] * 7
+            if HandState.BUST[state]:
+                outcomes[BUST] = 1.0
+            elif HandState.BLACKJACK[state]:
+                outcomes[DEALER_BLACKJACK] = 1.0
+            else:
+                outcomes[HandState.TOTAL[state] - 17] = 1.0
+            return tuple(outcomes)
+        outcomes = [0.0] * 7
+        for card, probability, remaining in self._draws(counts):
+            for i, p in enumerate(self._dealer(HandState.add_card(state, card), remaining)):
+                outcomes[i] += probability * p
+        return tuple(outcomes)
+
+    def dealer_outcomes(self, upcard, counts=None):
+        """
+        Distribution of the dealer's final total given the upcard.
+
+        Parameters:
+        - upcard: the dealer's visible card.
+        - counts: remaining cards per rank, the current shoe if None.
+
+        Returns:
+        - outcomes: probabilities of 17, 18, 19, 20, 21 (not blackjack), bust and blackjack, in the
+          order of OUTCOMES.
+        """
+        counts = self.counts if counts is None else tuple(counts)
+        return self._dealer(HandState.add_card(HandState.EMPTY_HAND, upcard), counts)
+
+    def _stand(self, value, upcard, counts):
+        if value > 21:
+            return -1.0
+        outcomes = self._dealer(HandState.add_card(HandState.EMPTY_HAND, upcard), counts)
+        win = outcomes[BUST]
+        # Without peek a dealer blackjack beats any hand but a natural, which is valued apart
+        lose = outcomes[DEALER_BLACKJACK]
+        for total, p in zip(OUTCOMES[:5], outcomes[:5]):
+            if total < value:
+                win += p
+            elif total > value:
+                lose += p
+        return win - lose
+
+    def _hit(self, state, upcard, counts):
+        ev = 0.0
+        for card, probability, _ in self._draws(counts):
+            new_state = HandState.add_card(state, card)
+            if HandState.BUST[new_state]:
+                ev -= probability
+            else:
+                ev += probability * self._player(new_state, upcard, counts, False)
+        return ev
+
+    def _double(self, state, upcard, counts):
+        ev = 0.0
+        for card, probability, _ in self._draws(counts):
+            ev += probability * self._stand(HandState.TOTAL[HandState.add_card(state, card)], upcard, counts)
+        return 2 * ev
+
+    def _player_best(self, state, upcard, counts, can_double):
+        # A hand reaching 21 ends, like in BlackjackEnv
+        ev = self._stand(HandState.TOTAL[state], upcard, counts)
+        if HandState.TOTAL[state] < 21:
+            ev = max(ev, self._hit(state, upcard, counts))
+            if can_double:
+                ev = max(ev, self._double(state, upcard, counts))
+        return ev
+
+    def _blackjack(self, upcard, counts):
+        outcomes = self._dealer(HandState.add_card(HandState.EMPTY_HAND, upcard), counts)
+        return self.rules.blackjack_payout * (1 - outcomes[DEALER_BLACKJACK])
+
+    def _split(self, card, upcard, counts):
+        # Each hand receives a card and is played without splitting again; the hands
+        # are valued independently from the same remaining shoe.
+        single = HandState.add_card(HandState.EMPTY_HAND, card)
+        ev = 0.0
+        for drawn, probability, _ in self._draws(counts):
+            ev += probability * self._player(HandState.add_card(single, drawn), upcard, counts,
+                                             self.rules.double_after_split)
+        return 2 * ev
+
+    def state_values(self, state, upcard, counts=None, pair_card=None, first_hand=True):
+        """
+        Expected gain of each action for a hand given by its HandState.
+
+        Parameters:
+        - state: HandState of the player's hand.
+        - upcard: the dealer's visible card.
+        - counts: remaining cards per rank, the current shoe if None.
+        - pair_card: card of the pair when the hand can be split.
+        - first_hand: the hand is the only hand of the seat (not coming from a split).
+
+        Returns:
+        - values: dict mapping each available action to its expected gain.
+        """
+        counts = self.counts if counts is None else tuple(counts)
+        if first_hand and HandState.BLACKJACK[state]:
+            return {Actions.STAND: self._blackjack(upcard, counts)}
+        values = {Actions.STAND: self._stand(HandState.TOTAL[state], upcard, counts)}
+        if HandState.TOTAL[state] < 21:
+            values[Actions.HIT] = self._hit(state, upcard, counts)
+        if state % 4 == 2:
+            if first_hand or self.rules.double_after_split:
+                values[Actions.DOUBLE] = self._double(state, upcard, counts)
+            if pair_card is not None:
+                values[Actions.SPLIT] = self._split(pair_card, upcard, counts)
+            if first_hand and self.rules.surrender:
+                # Early surrender: half the bet is lost whatever the dealer's hand, blackjack included
+                values[Actions.SURRENDER] = -0.5
+        return values
+
+    def expected_values(self, hands, upcard, counts=None):
+        """
+        Expected gain of each action for a unit bet, the hand being played optimally afterwards.
+
+        Parameters:
+        - hands: list of cards in the player's hand.
+        - upcard: the dealer's visible card.
+        - counts: remaining cards per rank, the current shoe if None.
+
+        Returns:
+        - values: dict mapping each available action to its expected gain.
+        """
+        pair_card = hands[0] if len(hands) == 2 and hands[0] == hands[1] else None
+        return self.state_values(HandState.hand_state(hands), upcard, counts, pair_card)
@@ -0,0 +1,42 @@
+"""
+Gym backend of the environments and their adapter to the gymnasium API.
+
+Only BlackjackEnv and MultiPartiesEnv import this module (VectorBlackjackEnv
+when its spaces are read), so the rules, the engine, the console game and the
+simulation workers never pay for importing gym. The backend is gymnasium, the
+maintained fork, when it is installed, and gym otherwise.
+
+The environments keep their own API, used throughout this repository: `reset`
+returns the observation and `step` returns (observation, reward, done,
+truncated), the observation being a buffer reused by the next call.
+GymnasiumEnv gives them the gymnasium one.
+"""
+try:
+    import gymnasium as gym
+except ImportError:
+    import gym
+
+spaces = gym.spaces
+
+
+class GymnasiumEnv(gym.Wrapper):
+    """
+    gymnasium API of a BlackjackEnv or a MultiPartiesEnv.
+
+    `reset(seed=None, options=None)` returns (observation, info), a seed reseeding the shoe
+    of the environment (and the player counts of a MultiPartiesEnv) before the deal, and
+    `step(action)` returns (observation, reward, terminated, truncated, info). The
+    observations are copies, and info holds the number of cards left per card value.
+    """
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.counts = env.unwrapped.shoe.counts
+
+    def reset(self, seed=None, options=None):
+        obs = self.env.reset(seed=seed, options=options)
+        return obs.copy(), {'counts': list(self.counts)}
+
+    def step(self, action):
+        obs, reward, done, truncated = self.env.step(action)
+        return obs.copy(), reward, done, truncated, {'counts': list(self.counts)}
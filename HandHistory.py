@@ -0,0 +1,203 @@
+"""
+Hand histories in fixed-width binary records, written in chunks and read back with numpy.memmap.
+
+A history is two files next to each other:
+
+- `{path}.hands`: one HAND_RECORD per hand of a round, with the round number,
+  the shoe position of its first card, the seat and hand index, the cards of
+  the hand and of the dealer, the actions played, the bet and the gain.
+- `{path}.decisions`: one decision record per BlackjackEnv step, with the round
+  number, seat and hand, the Observation given to the agent, the action and
+  whether it was available.
+
+Each file starts with a HEADER_SIZE header (magic, version, record kind and
+observation size) followed by the records, packed with struct into a buffer
+flushed every `chunk_size` records. The reader maps the records as a numpy
+structured array, so a column such as `hands['payout']` is a view on the file
+and nothing is parsed or copied until it is used.
+"""
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'BJHH'
+VERSION = 1
+HEADER = struct.Struct('<4sHcxH6x')
+HEADER_SIZE = HEADER.size
+# Longer hands are truncated in the record, `nb_cards` keeping the real number of cards
+MAX_CARDS = 16
+MAX_ACTIONS = 16
+
+HAND_RECORD = np.dtype([
+    ('round', '<u8'), ('shoe_position', '<u2'), ('seat', 'u1'), ('hand', 'u1'),
+    ('nb_cards', 'u1'), ('cards', 'u1', (MAX_CARDS,)),
+    ('nb_dealer', 'u1'), ('dealer', 'u1', (MAX_CARDS,)),
+    ('nb_actions', 'u1'), ('actions', 'u1', (MAX_ACTIONS,)),
+    ('bet', '<f4'), ('payout', '<f4'),
+])
+HAND_FORMAT = struct.Struct(f'<QHBBB{MAX_CARDS}sB{MAX_CARDS}sB{MAX_ACTIONS}sff')
+
+
+def decision_record(obs_size):
+    """
+    Dtype of a decision record for observations of `obs_size` values.
+    """
+    return np.dtype([('round', '<u8'), ('seat', 'u1'), ('hand', 'u1'), ('action', 'u1'), ('valid', '?'),
+                     ('obs', '<i2', (obs_size,))])
+
+
+class _RecordFile:
+    """
+    Append-only file of fixed-width records, buffered in chunks.
+    """
+
+    def __init__(self, path, kind, record_struct, obs_size=0, chunk_size=65536):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, kind, obs_size))
+        self.record_struct = record_struct
+        self.size = record_struct.size
+        self.buffer = bytearray(chunk_size * self.size)
+        self.position = 0
+
+    def append(self, *values):
+        if self.position == len(self.buffer):
+            self.flush()
+        self.record_struct.pack_into(self.buffer, self.position, *values)
+        self.position += self.size
+
+    def flush(self):
+        self.file.write(memoryview(self.buffer)[:self.position])
+        self.position = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class HandHistoryWriter:
+    """
+    Records the hands, and optionally the decisions, of the rounds played.
+
+    Parameters:
+    - path: prefix of the `.hands` and `.decisions` files.
+    - obs_size: size of the observations of the decisions (Observation.size), 0 for no decision file.
+    - chunk_size: number of records buffered before a write.
+    """
+
+    def __init__(self, path, obs_size=0, chunk_size=65536):
+        self.path = path
+        self.round = 0
+        self.hands = _RecordFile(f'{path}.hands', b'H', HAND_FORMAT, chunk_size=chunk_size)
+        self.decisions = None
+        if obs_size:
+            self.decisions = _RecordFile(f'{path}.decisions', b'D', struct.Struct(f'<QBBB?{2 * obs_size}s'),
+                                         obs_size, chunk_size)
+
+    def new_round(self):
+        """
+        Starts a new round and returns its number.
+        """
+        self.round += 1
+        return self.round
+
+    def record_hand(self, shoe_position, seat, hand, cards, dealer, actions, bet, payout):
+        """
+        Appends a hand of the current round.
+
+        Parameters:
+        - shoe_position: position in the shoe of the first card of the round.
+        - seat, hand: seat of the player and index of the hand (splits).
+        - cards, dealer: cards of the hand and of the dealer.
+        - actions: Actions values played on the hand, in order.
+        - bet, payout: final bet of the hand and its gain.
+        """
+        # struct pads the card and action strings with zeros, or truncates them, to their fixed width
+        self.hands.append(self.round, shoe_position, seat, hand, len(cards), bytes(cards), len(dealer), bytes(dealer),
+                          len(actions), bytes(actions), bet, payout)
+
+    def record_decision(self, seat, hand, obs, action, valid):
+        """
+        Appends a decision of the current round, `obs` being the int16 observation given to the agent.
+        """
+        self.decisions.append(self.round, seat, hand, action, valid, obs.tobytes())
+
+    def flush(self):
+        self.hands.flush()
+        if self.decisions is not None:
+            self.decisions.flush()
+
+    def close(self):
+        self.hands.close()
+        if self.decisions is not None:
+            self.decisions.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map(path, kind):
+    with open(path, 'rb') as file:
+        magic, version, file_kind, obs_size = HEADER.unpack(file.read(HEADER_SIZE))
+    if magic != MAGIC or file_kind != kind:
+        raise ValueError(f'{path} is not a hand history {kind.decode()} file')
+    if version != VERSION:
+        raise ValueError(f'{path} has version {version}, expected {VERSION}')
+    dtype = HAND_RECORD if kind == b'H' else decision_record(obs_size)
+    length = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(length,))
+
+
+class HandHistory:
+    """
+    Read-only view of a hand history, the records being memory-mapped.
+
+    - hands: structured array of HAND_RECORD.
+    - decisions: structured array of decision records, None without a decision file.
+    """
+
+    def __init__(self, path):
+        self.hands = _map(f'{path}.hands', b'H')
+        try:
+            self.decisions = _map(f'{path}.decisions', b'D')
+        except FileNotFoundError:
+            self.decisions = None
+
+    def round_gains(self, rounds):
+        """
+        Returns the sum of the gains of the hands of each round of `rounds`.
+        """
+        hand_rounds = self.hands['round']
+        cumulative = np.concatenate([[0.0], np.cumsum(self.hands['payout'], dtype=np.float64)])
+        return (cumulative[np.searchsorted(hand_rounds, rounds, 'right')]
+                - cumulative[np.searchsorted(hand_rounds, rounds, 'left')])
+
+    def transitions(self):
+        """
+        Rebuilds the BlackjackEnv transitions of the recorded decisions, without simulating.
+
+        As in BlackjackEnv, the reward is -1 for an unavailable action, the gains of the round
+        for its last decision and 0 otherwise, and the observation after the last decision of
+        a round is all zeros.
+
+        Returns:
+        - transitions: (obs, action, reward, next_obs, done) arrays, obs being a view on the file.
+        """
+        decisions = self.decisions
+        obs = decisions['obs']
+        rounds = decisions['round']
+        done = np.ones(len(decisions), dtype=bool)
+        done[:-1] = rounds[1:] != rounds[:-1]
+        next_obs = np.zeros_like(obs)
+        next_obs[:-1] = obs[1:]
+        next_obs[done] = 0
+        reward = np.zeros(len(decisions), dtype=np.float32)
+        reward[done] = self.round_gains(rounds[done])
+        reward[~decisions['valid']] = -1
+        return obs, decisions['action'].astype(np.int64), reward, next_obs, done
@@ -0,0 +1,131 @@
+"""
+Hand states shared by the game and the environments.
+
+A hand is stored as a single int code instead of a list of cards. The code packs
+the hard total (aces counted as 1), whether the hand holds an ace and the number
+of cards (capped at 3, only 2 matters for a blackjack):
+
+    code = (hard * 2 + has_ace) * 4 + min(nb_cards, 3)
+
+Adding a card is a lookup in NEXT, and the value, soft flag, bust and blackjack
+status of a hand are lookups in TOTAL, SOFT, BUST and BLACKJACK. Cards use the
+values of the decks: 2 to 10 and 11 for an ace.
+"""
+
+MAX_HARD = 31
+NB_STATES = (MAX_HARD + 1) * 2 * 4
+EMPTY_HAND = 0
+
+
+def encode(hard, has_ace, nb_cards):
+    return (hard * 2 + has_ace) * 4 + min(nb_cards, 3)
+
+
+def decode(state):
+    """
+    Returns the (hard_total, has_ace, nb_cards) tuple of a hand state, nb_cards being capped at 3.
+    """
+    return state // 8, state // 4 % 2, state % 4
+
+
+def _build_tables():
+    next_state = [[EMPTY_HAND] * 12 for _ in range(NB_STATES)]
+    total = [0] * NB_STATES
+    soft = [False] * NB_STATES
+    for state in range(NB_STATES):
+        hard, has_ace, nb_cards = decode(state)
+        soft[state] = bool(has_ace) and hard + 10 <= 21
+        total[state] = hard + 10 if soft[state] else hard
+        for card in range(2, 12):
+            new_hard = min(hard + (1 if card == 11 else card), MAX_HARD)
+            next_state[state][card] = encode(new_hard, has_ace or card == 11, nb_cards + 1)
+    bust = [value > 21 for value in total]
+    blackjack = [total[state] == 21 and state % 4 == 2 for state in range(NB_STATES)]
+    return next_state, total, soft, bust, blackjack
+
+
+NEXT, TOTAL, SOFT, BUST, BLACKJACK = _build_tables()
+# Whether the dealer draws on each state, indexed by hit_soft_17 (S17 then H17)
+DEALER_HITS = tuple([TOTAL[state] < 17 or (hit_soft_17 and TOTAL[state] == 17 and SOFT[state])
+                     for state in range(NB_STATES)] for hit_soft_17 in (False, True))
+
+
+def add_card(state, card):
+    """
+    Returns the state of the hand `state` after drawing `card`.
+    """
+    return NEXT[state][card]
+
+
+def hand_state(hands):
+    """
+    Returns the state of a list of cards.
+    """
+    state = EMPTY_HAND
+    for card in hands:
+        state = NEXT[state][card]
+    return state
+
+
+def value_hands(hands):
+    """
+    Calculates the value of a hand taking into account aces.
+
+    Parameters:
+    - hands: list of cards in the hand.
+
+    Returns:
+    - value: value of the hand.
+    """
+    return TOTAL[hand_state(hands)]
+
+
+def _legacy_value_hands(hands):
+    value = 0
+    num_aces = 0
+    for card in hands:
+        if card == 11:
+            num_aces += 1
+            value += 11
+        else:
+            value += card
+    while value > 21 and num_aces > 0:
+        value -= 10
+        num_aces -= 1
+    return value
+
+
+if __name__ == '__main__':
+    # Microbenchmark against the loop that used to live in BlackjackGame and BlackjackEnv
+    import random
+    import timeit
+
+    deck = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11] * 4
+    hands = [random.sample(deck, random.randint(2, 5)) for _ in range(10000)]
+    assert all(value_hands(hand) == _legacy_value_hands(hand) for hand in hands if _legacy_value_hands(hand) <= 21)
+
+    def dealer_legacy():
+        for hand in hands:
+            dealer = hand[:2]
+            for card in hand[2:]:
+                if _legacy_value_hands(dealer) >= 17:
+                    break
+                dealer.append(card)
+
+    def dealer_table():
+        for hand in hands:
+            state = NEXT[NEXT[EMPTY_HAND][hand[0]]][hand[1]]
+            for card in hand[2:]:
+                if TOTAL[state] >= 17:
+                    break
+                state = NEXT[state][card]
+
+    for name, legacy, table in [
+        ('value_hands', lambda: [_legacy_value_hands(hand) for hand in hands], lambda: [value_hands(hand) for hand in hands]),
+        ('dealer draw', dealer_legacy, dealer_table),
+    ]:
+        legacy_time = min(timeit.repeat(legacy, number=10, repeat=3))
+        table_time = min(timeit.repeat(table, number=10, repeat=3))
+        per_hand = 1e6 / (10 * len(hands))
+        print(f'{name}: loop {legacy_time * per_hand:.2f} us/hand, table {table_time * per_hand:.2f} us/hand, '
+              f'x{legacy_time / table_time:.1f}')
@@ -0,0 +1,217 @@
+"""
+Counters and timers of the phases of a round, for profiling the game and the environments in production.
+
+Instrumentation is off unless an Instruments is given to BlackjackEngine or
+BlackjackEnv, or the BLACKJACK_INSTRUMENT environment variable is set, in
+which case DEFAULT is shared by every engine and environment of the process:
+
+    BLACKJACK_INSTRUMENT=1                 collect, export with DEFAULT.write_prometheus or dump_stats
+    BLACKJACK_INSTRUMENT=metrics.prom      also write the Prometheus text file at exit
+    BLACKJACK_INSTRUMENT=round.prof        also write the pstats file at exit
+
+An instrumented object has its phase methods replaced, on the instance, by
+timed wrappers when it is built, and an object without instruments keeps its
+plain methods: disabled instrumentation costs nothing on the hot path. The
+timers are nested like the calls, so each phase has the time spent in its own
+code (tottime) and with the phases it calls (cumtime), as in cProfile, and
+dump_stats writes them in the marshal format read by pstats.Stats. The
+agent is timed the same way, by wrapping its policy:
+`policy = instruments.timed('agent', policy)`.
+"""
+import atexit
+import marshal
+import os
+import time
+
+# Names of the BlackjackEngine.Actions, by value (imported by the engine, this module does not import it)
+ACTION_NAMES = ['hit', 'stand', 'split', 'double', 'surrender']
+
+
+class Instruments:
+    """
+    Timers per phase and counters per action, with their Prometheus and pstats exports.
+
+    - timers: phase -> [calls, tottime, cumtime, callers], callers mapping each calling
+      phase to the same [calls, tottime, cumtime] for the calls it made.
+    - actions: (action name, valid) -> number of actions applied.
+    - counters: name -> value of the other counters (count).
+    """
+
+    def __init__(self, prefix='blackjack'):
+        self.prefix = prefix
+        self.timers = {}
+        self.actions = {}
+        self.counters = {}
+        # Phases running, innermost last, with the time spent in the phases they called
+        self.stack = []
+
+    def timed(self, phase, func):
+        """
+        Returns `func` timing each of its calls as `phase`.
+        """
+        stats = self.timers.setdefault(phase, [0, 0.0, 0.0, {}])
+        stack = self.stack
+        clock = time.perf_counter
+
+        def timed_call(*args, **kwargs):
+            frame = [phase, 0.0]
+            stack.append(frame)
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                stack.pop()
+                own = elapsed - frame[1]
+                stats[0] += 1
+                stats[1] += own
+                stats[2] += elapsed
+                caller = stack[-1][0] if stack else None
+                edge = stats[3].get(caller)
+                if edge is None:
+                    edge = stats[3][caller] = [0, 0.0, 0.0]
+                edge[0] += 1
+                edge[1] += own
+                edge[2] += elapsed
+                if stack:
+                    stack[-1][1] += elapsed
+        return timed_call
+
+    def counted_actions(self, phase, func):
+        """
+        Returns `func`, taking an action (an Actions member or its value) first, timed as `phase`
+        and counting each action with its validity.
+        """
+        timed_call = self.timed(phase, func)
+        actions = self.actions
+
+        def counted_call(action, *args):
+            result = timed_call(action, *args)
+            # BlackjackEnv.step returns a transition, an unavailable action being penalised by -1
+            # without ending the round; BlackjackEngine.apply_action returns the validity
+            valid = result if isinstance(result, bool) else not (result[1] == -1 and not result[2])
+            key = (ACTION_NAMES[int(getattr(action, 'value', action))], valid)
+            actions[key] = actions.get(key, 0) + 1
+            return result
+        return counted_call
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        # The wrappers hold the lists of their phase, zeroed in place so that they keep counting
+        for stats in self.timers.values():
+            stats[:] = [0, 0.0, 0.0, {}]
+        self.actions.clear()
+        self.counters.clear()
+
+    def frequencies(self, per='deal'):
+        """
+        Returns the number of valid actions of each kind per call of the phase `per` (per round
+        for 'deal' or 'reset').
+        """
+        calls = self.timers.get(per, [0])[0]
+        return {name: self.actions.get((name, True), 0) / calls if calls else 0.0 for name in ACTION_NAMES}
+
+    def prometheus(self):
+        """
+        Returns the counters and timers in the Prometheus text exposition format.
+        """
+        prefix = self.prefix
+        lines = [f'# HELP {prefix}_phase_calls_total Calls of each phase.',
+                 f'# TYPE {prefix}_phase_calls_total counter']
+        lines += [f'{prefix}_phase_calls_total{{phase="{phase}"}} {stats[0]}' for phase, stats in self.timers.items()]
+        lines += [f'# HELP {prefix}_phase_seconds_total Time spent in each phase, the phases it calls included.',
+                  f'# TYPE {prefix}_phase_seconds_total counter']
+        lines += [f'{prefix}_phase_seconds_total{{phase="{phase}"}} {stats[2]:.9f}'
+                  for phase, stats in self.timers.items()]
+        lines += [f'# HELP {prefix}_phase_self_seconds_total Time spent in each phase, the phases it calls excluded.',
+                  f'# TYPE {prefix}_phase_self_seconds_total counter']
+        lines += [f'{prefix}_phase_self_seconds_total{{phase="{phase}"}} {stats[1]:.9f}'
+                  for phase, stats in self.timers.items()]
+        lines += [f'# HELP {prefix}_actions_total Actions applied, by action and validity.',
+                  f'# TYPE {prefix}_actions_total counter']
+        lines += [f'{prefix}_actions_total{{action="{action}",valid="{str(valid).lower()}"}} {value}'
+                  for (action, valid), value in sorted(self.actions.items())]
+        for name, value in self.counters.items():
+            lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Writes the Prometheus text to `path`, atomically for the textfile collectors reading it.
+        """
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            file.write(self.prometheus())
+        os.replace(temporary, path)
+
+    def pstats(self):
+        """
+        Returns the timers as the stats dict of cProfile, the phases being functions of this module.
+        """
+        def key(phase):
+            return ('Instrumentation', 0, phase)
+        stats = {}
+        for phase, (calls, tottime, cumtime, callers) in self.timers.items():
+            stats[key(phase)] = (calls, calls, tottime, cumtime,
+                                 {key(caller): (edge[0], edge[0], edge[1], edge[2])
+                                  for caller, edge in callers.items() if caller is not None})
+        return stats
+
+    def dump_stats(self, path):
+        """
+        Writes the timers to `path` in the format of cProfile.Profile.dump_stats, for pstats.Stats.
+        """
+        with open(path, 'wb') as file:
+            marshal.dump(self.pstats(), file)
+
+    def summary(self):
+        """
+        Returns a cProfile-like table of the phases, by cumulative time, and the action frequencies.
+        """
+        lines = [f'{"ncalls":>10} {"tottime":>10} {"percall":>10} {"cumtime":>10} {"percall":>10}  phase']
+        for phase, (calls, tottime, cumtime, _) in sorted(self.timers.items(), key=lambda item: -item[1][2]):
+            lines.append(f'{calls:>10} {tottime:>10.3f} {tottime / max(calls, 1) * 1e6:>8.2f}us '
+                         f'{cumtime:>10.3f} {cumtime / max(calls, 1) * 1e6:>8.2f}us  {phase}')
+        frequencies = self.frequencies('deal' if 'deal' in self.timers else 'reset')
+        lines.append('actions per round: ' + ', '.join(f'{name} {value:.3f}' for name, value in frequencies.items()))
+        return '\n'.join(lines)
+
+
+def _from_environment():
+    value = os.environ.get('BLACKJACK_INSTRUMENT', '')
+    if value in ('', '0'):
+        return None
+    instruments = Instruments()
+    if value != '1':
+        atexit.register(instruments.dump_stats if value.endswith('.prof') else instruments.write_prometheus, value)
+    return instruments
+
+
+# Instruments of the process when BLACKJACK_INSTRUMENT is set, None otherwise
+DEFAULT = _from_environment()
+
+
+def instrument_engine(engine, instruments):
+    """
+    Times the shuffle, deal, decisions, dealer play and settlement of a BlackjackEngine, and
+    counts its actions.
+    """
+    engine.shuffle = instruments.timed('shuffle', engine.shuffle)
+    engine.deal = instruments.timed('deal', engine.deal)
+    engine.apply_action = instruments.counted_actions('decision', engine.apply_action)
+    engine.play_dealer_hand = instruments.timed('dealer', engine.play_dealer_hand)
+    engine.settle_round = instruments.timed('settlement', engine.settle_round)
+
+
+def instrument_env(env, instruments):
+    """
+    Times the reset (shuffle and deal), steps, dealer play and settlement of a BlackjackEnv,
+    and counts its actions.
+    """
+    env.shoe.shuffle = instruments.timed('shuffle', env.shoe.shuffle)
+    env.reset = instruments.timed('reset', env.reset)
+    env.step = instruments.counted_actions('step', env.step)
+    env.play_dealer_hand = instruments.timed('dealer', env.play_dealer_hand)
+    env.settle = instruments.timed('settlement', env.settle)
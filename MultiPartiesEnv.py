@@ -1,46 +1,74 @@
-import gym
 import numpy as np
+
+from GymAdapter import gym
+from Shoe import InfiniteShoe
+
+
 class MultiPartiesEnv(gym.Wrapper):
-    def __init__(self, env=None, min_players=1, max_players=6, cards_threshold=0.5):
+    """
+    Plays a whole shoe per episode, with a number of players drawn for each round.
+
+    The wrapped BlackjackEnv keeps its seat arrays and its shoe between rounds:
+    only the number of seats dealt changes (`set_player_count`), so a round
+    costs the same whatever the number of players of the previous one. The
+    episode ends with the round during which `cards_threshold` of the shoe is
+    dealt, or the shoe's own cut card if it comes first; the next reset shuffles
+    the shoe. The shoe's cut card is left as it is, and an InfiniteShoe, which is
+    never dealt out, is rejected.
+    """
+    def __init__(self, env=None, min_players=1, max_players=None, cards_threshold=None, seed=None):
         super(MultiPartiesEnv, self).__init__(env)
+        # Par défaut, les sièges et la pénétration viennent des règles de l'environnement
+        rules = env.rules
         self.min_players = min_players
-        self.max_players = max_players
-        self.cards_threshold = cards_threshold
+        self.max_players = rules.number_seats if max_players is None else max_players
+        if not 1 <= self.min_players <= self.max_players <= rules.number_seats:
+            raise ValueError(f'the number of players must be between 1 and {rules.number_seats}')
+        self.cards_threshold = rules.penetration if cards_threshold is None else cards_threshold
+        self.shoe = env.shoe
+        if isinstance(self.shoe, InfiniteShoe):
+            raise ValueError('MultiPartiesEnv plays a whole shoe per episode, it cannot use an InfiniteShoe')
+        # Nombre de cartes distribuées qui termine l'épisode, la carte de coupe du sabot restant la sienne
+        self.cards_limit = int(self.cards_threshold * self.shoe.len_deck)
+        self.rng = np.random.default_rng(seed)
         self.current_player_count = None
-        self.cards_dealt = 0  # Nombre de cartes distribuées
-
-    def reset(self):
-        # Réinitialiser l'environnement et les compteurs
-        obs = self.env.reset()
-        self.cards_dealt = 0
-        
-        # Démarrer une nouvelle partie
-        self.start_new_partie()
-        
-        return obs
+        self.rounds = 0  # Nombre de manches jouées dans le sabot
+
+    @property
+    def cards_dealt(self):
+        # Nombre de cartes distribuées depuis le dernier mélange
+        return self.shoe.cursor
+
+    def reset(self, seed=None, options=None):
+        # Une graine réinitialise le sabot et le tirage du nombre de joueurs
+        if seed is not None:
+            self.env.seed(seed)
+            self.rng = np.random.default_rng(seed)
+        # Mélanger le sabot et démarrer la première partie de l'épisode
+        self.shoe.shuffle()
+        self.rounds = 0
+        return self.start_new_partie()
 
     def start_new_partie(self):
         """Lance une nouvelle partie en demandant à l'agent combien de joueurs il veut."""
         self.current_player_count = self.agent_select_player_count()
-        
+
         # Configurer le nombre de joueurs pour cette partie
         self.env.set_player_count(self.current_player_count)
+        self.rounds += 1
+        return self.env.reset()
 
     def step(self, action):
         # Effectuer une action dans l'environnement
-        obs, reward, done, info = self.env.step(action)
-        
-        # Mettre à jour le nombre de cartes distribuées
-        self.cards_dealt += info.get('cards_dealt_this_turn', 0)
-        
-        # Vérifier si la partie actuelle est terminée
-        if self.cards_dealt >= self.cards_threshold * self.env.total_cards:
-            # Si la moitié des cartes sont distribuées, démarrer une nouvelle partie
-            self.cards_dealt = 0
-            self.start_new_partie()
-        
-        return obs, reward, done, info
+        obs, reward, done, truncated = self.env.step(action)
+        if not done:
+            return obs, reward, False, truncated
+
+        # La partie est finie : l'épisode se termine avec le sabot, sinon une nouvelle partie commence
+        if self.shoe.cursor >= self.cards_limit or self.shoe.needs_shuffle:
+            return obs, reward, True, truncated
+        return self.start_new_partie(), reward, False, truncated
 
     def agent_select_player_count(self):
         # Logique pour que l'agent sélectionne le nombre de joueurs (peut être remplacée par une logique d'agent réelle)
-        return np.random.randint(self.min_players, self.max_players + 1)
+        return int(self.rng.integers(self.min_players, self.max_players + 1))
@@ -0,0 +1,95 @@
+"""
+Flat int16 observation shared by BlackjackEnv and VectorBlackjackEnv.
+
+    [player total, soft, dealer card, can split, can double, can surrender]
+
+followed, when the shoe composition is observed, by the number of cards left
+of each rank (2 to 10, then 11 for an ace) and the Hi-Lo true count truncated
+to an int and clipped to [-MAX_TRUE_COUNT, MAX_TRUE_COUNT].
+"""
+import numpy as np
+
+import Counting
+import HandState
+
+PLAYER_TOTAL, SOFT, DEALER_CARD, CAN_SPLIT, CAN_DOUBLE, CAN_SURRENDER = range(6)
+COUNTS = slice(6, 16)
+TRUE_COUNT = 16
+BASE_SIZE = 6
+FULL_SIZE = 17
+RANKS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+MAX_TRUE_COUNT = 20
+
+
+def size(with_counts=False):
+    return FULL_SIZE if with_counts else BASE_SIZE
+
+
+def bounds(number_deck, with_counts=False):
+    """
+    Returns the (low, high) arrays of the observation, for the observation space.
+    """
+    low = np.zeros(size(with_counts), dtype=np.int16)
+    high = np.array([HandState.MAX_HARD, 1, 11, 1, 1, 1], dtype=np.int16)
+    if with_counts:
+        low[TRUE_COUNT] = -MAX_TRUE_COUNT
+        counts = [16 * number_deck if rank == 10 else 4 * number_deck for rank in RANKS]
+        high = np.concatenate([high, counts, [MAX_TRUE_COUNT]]).astype(np.int16)
+    return low, high
+
+
+def true_count(counts, full_counts):
+    """
+    Hi-Lo true count: running count of the dealt cards divided by the decks left.
+
+    Parameters:
+    - counts: cards left per card value (indexed 0 to 11), like Shoe.counts.
+    - full_counts: the same counts for a full shoe.
+    """
+    return Counting.true_count(Counting.running_count('hi_lo', counts, full_counts), sum(counts[2:12]))
+
+
+def encode(obs, state, dealer_card, can_split, can_double, can_surrender, counts=None, full_counts=None,
+           count=None):
+    """
+    Writes an observation into the preallocated buffer `obs` and returns it.
+
+    Parameters:
+    - obs: int16 buffer of `size(with_counts)` values, reused between calls.
+    - state: HandState of the hand playing.
+    - dealer_card: the dealer's visible card.
+    - can_split, can_double, can_surrender: whether the split, the double and the surrender are available.
+    - counts, full_counts: cards left per card value and for a full shoe, when observed.
+    - count: Hi-Lo true count kept by the shoe (Counting.CountingShoe), computed from the counts if None.
+    """
+    obs[PLAYER_TOTAL] = HandState.TOTAL[state]
+    obs[SOFT] = HandState.SOFT[state]
+    obs[DEALER_CARD] = dealer_card
+    obs[CAN_SPLIT] = can_split
+    obs[CAN_DOUBLE] = can_double
+    obs[CAN_SURRENDER] = can_surrender
+    if counts is not None:
+        for i, card in enumerate(RANKS):
+            obs[COUNTS.start + i] = counts[card]
+        if count is None:
+            count = true_count(counts, full_counts)
+        obs[TRUE_COUNT] = min(max(count, -MAX_TRUE_COUNT), MAX_TRUE_COUNT)
+    return obs
+
+
+def decode(obs):
+    """
+    Returns the observation as a dict, for debugging.
+    """
+    decoded = {
+        'player_total': int(obs[PLAYER_TOTAL]),
+        'soft': bool(obs[SOFT]),
+        'dealer_card': int(obs[DEALER_CARD]),
+        'can_split': bool(obs[CAN_SPLIT]),
+        'can_double': bool(obs[CAN_DOUBLE]),
+        'can_surrender': bool(obs[CAN_SURRENDER]),
+    }
+    if len(obs) == FULL_SIZE:
+        decoded['counts'] = dict(zip(RANKS, obs[COUNTS].tolist()))
+        decoded['true_count'] = int(obs[TRUE_COUNT])
+    return decoded
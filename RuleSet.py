@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+_RuleSet = namedtuple('_RuleSet', [
+    'number_deck', 'penetration', 'hit_soft_17', 'double_after_split', 'max_splits', 'surrender',
+    'blackjack_payout', 'number_seats',
+])
+
+
+class RuleSet(_RuleSet):
+    """
+    Rules of a table, immutable and hashable so it can key caches.
+
+    - number_deck: number of decks in the shoe.
+    - penetration: fraction of the shoe dealt before the cut card.
+    - hit_soft_17: the dealer hits soft 17 (H17) instead of standing (S17).
+    - double_after_split: a hand coming from a split can be doubled (DAS).
+    - max_splits: number of splits allowed per seat, 1 for no resplit.
+    - surrender: early surrender, a hand can be surrendered on its first two cards, before any
+      split, for half the bet, even when the dealer then has a blackjack.
+    - blackjack_payout: gain of a natural blackjack for a unit bet (1.5 for 3:2, 1.2 for 6:5).
+    - number_seats: number of seats at the table.
+
+    The default values are the rules the game and the environments always had.
+    The dealer has no hole-card peek: against a dealer blackjack every bet of the
+    round is lost, doubles and splits included.
+    """
+    __slots__ = ()
+
+    def __new__(cls, number_deck=6, penetration=0.5, hit_soft_17=False, double_after_split=True, max_splits=1,
+                surrender=False, blackjack_payout=1.0, number_seats=7):
+        if number_deck < 1:
+            raise ValueError('number_deck must be at least 1')
+        if not 0 < penetration < 1:
+            raise ValueError('penetration must be between 0 and 1')
+        if max_splits < 0:
+            raise ValueError('max_splits must be at least 0')
+        if not 1 <= number_seats <= 7:
+            raise ValueError('number_seats must be between 1 and 7')
+        return super().__new__(cls, number_deck, penetration, hit_soft_17, double_after_split, max_splits,
+                               surrender, blackjack_payout, number_seats)
+
+    @property
+    def max_hands(self):
+        """
+        Maximum number of hands of a seat in a round.
+        """
+        return self.max_splits + 1
+
+    def key(self):
+        """
+        Short string identifying the rules that change the strategy, for file names.
+        """
+        return (f'{self.number_deck}d_{"h17" if self.hit_soft_17 else "s17"}_{"das" if self.double_after_split else "ndas"}'
+                f'_sp{self.max_splits}_{"es" if self.surrender else "ns"}_bj{self.blackjack_payout:g}')
@@ -0,0 +1,144 @@
+import random
+
+CARDS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11]
+
+
+class Shoe:
+    """
+    Shoe of `number_deck` decks dealt from a preallocated list with a cursor.
+
+    The shoe is shuffled lazily: `shuffle` only puts every card back, and each
+    draw is one step of a Fisher-Yates shuffle, swapping a random card of the
+    undealt part to the cursor. A round therefore only pays for the cards it
+    deals, whatever the number of decks. Drawing a card updates `counts`, the
+    number of cards of each value left in the shoe (indexed by the card value,
+    2 to 11). `needs_shuffle` becomes True once the cursor has passed the cut
+    card, placed at `penetration` of the shoe; a small penetration approximates
+    a continuous shuffler.
+
+    The game calls `start_round` before dealing a round. If the shoe runs out
+    during the round, only the discards are shuffled back: the cards of the
+    round stay on the table, out of the shoe and of `counts`.
+    """
+
+    def __init__(self, number_deck, penetration=0.5, rng=None):
+        self.number_deck = number_deck
+        self.penetration = penetration
+        self.rng = rng or random.Random()
+        self.random = self.rng.random
+        self.cards = CARDS * 4 * number_deck
+        self.len_deck = len(self.cards)
+        self.cut_card = int(self.len_deck * penetration)
+        self.full_counts = [self.cards.count(card) for card in range(12)]
+        self.counts = self.full_counts[:]
+        self.cursor = 0
+        self.round_start = 0
+        self.shuffle()
+
+    def seed(self, seed=None):
+        """
+        Reseeds the shoe and puts its cards back in order, so that a seed always deals the same cards.
+        """
+        self.rng.seed(seed)
+        self.cards[:] = CARDS * 4 * self.number_deck
+        self.shuffle()
+
+    def shuffle(self):
+        self.cursor = 0
+        self.round_start = 0
+        self.counts[:] = self.full_counts
+
+    def start_round(self):
+        """
+        Marks the cards dealt from now on as the cards of a round, on the table until it ends.
+        """
+        self.round_start = self.cursor
+
+    def shuffle_discards(self):
+        """
+        Shuffles the discards back when the shoe runs out during a round, the cards of the round
+        staying dealt. A round that dealt the whole shoe leaves no discards, and puts every card back.
+        """
+        if self.round_start == 0:
+            self.shuffle()
+            return
+        cards = self.cards
+        in_play = cards[self.round_start:self.cursor]
+        cards[:] = in_play + cards[:self.round_start]
+        self.counts[:] = self.full_counts
+        for card in in_play:
+            self.counts[card] -= 1
+        self.cursor = len(in_play)
+        self.round_start = 0
+
+    def draw(self):
+        cards = self.cards
+        cursor = self.cursor
+        if cursor == self.len_deck:
+            # The shoe ran out during a round
+            self.shuffle_discards()
+            cursor = self.cursor
+        # Fisher-Yates step: the card at the cursor is drawn uniformly from the undealt cards
+        j = cursor + int(self.random() * (self.len_deck - cursor))
+        card = cards[j]
+        cards[j] = cards[cursor]
+        cards[cursor] = card
+        self.cursor = cursor + 1
+        self.counts[card] -= 1
+        return card
+
+    @property
+    def needs_shuffle(self):
+        return self.cursor > self.cut_card
+
+    def __len__(self):
+        """
+        Number of cards left in the shoe.
+        """
+        return self.len_deck - self.cursor
+
+
+class InfiniteShoe:
+    """
+    Infinite-deck shoe: every card is drawn independently from the rank probabilities.
+
+    It has the interface of Shoe, `counts` and `full_counts` staying those of a
+    full shoe of `number_deck` decks since the composition never changes, and it
+    never needs a shuffle. The cursor counts the cards dealt like in Shoe, for
+    the shoe positions of the hand history, and wraps around after `len_deck`
+    cards as if a shoe had been dealt out and shuffled back.
+    """
+
+    def __init__(self, number_deck=8, penetration=0.5, rng=None):
+        self.number_deck = number_deck
+        self.penetration = penetration
+        self.rng = rng or random.Random()
+        self.random = self.rng.random
+        self.len_deck = len(CARDS) * 4 * number_deck
+        self.cut_card = self.len_deck
+        self.full_counts = [(CARDS * 4 * number_deck).count(card) for card in range(12)]
+        self.counts = self.full_counts[:]
+        self.cursor = 0
+
+    def seed(self, seed=None):
+        self.rng.seed(seed)
+        self.shuffle()
+
+    def shuffle(self):
+        self.cursor = 0
+
+    def start_round(self):
+        pass
+
+    def draw(self):
+        cursor = self.cursor + 1
+        self.cursor = cursor if cursor < self.len_deck else 0
+        return CARDS[int(self.random() * 13)]
+
+    @property
+    def needs_shuffle(self):
+        return False
+
+    def __len__(self):
+        return self.len_deck - self.cursor
+
@@ -0,0 +1,206 @@
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from BlackjackEngine import Actions
+from RuleSet import RuleSet
+from VectorBlackjackEnv import VectorBlackjackEnv
+
+# House edge change of single rules, in percent of the initial bet, from the published rule
+# variation tables for six decks (Wizard of Odds). The base game here has no hole-card peek,
+# so the surrender it offers is an early surrender.
+PUBLISHED_RULE_EFFECTS = [
+    ('dealer hits soft 17', {'hit_soft_17': True}, 0.22),
+    ('no double after split', {'double_after_split': False}, 0.14),
+    ('resplit to 4 hands', {'max_splits': 3}, -0.05),
+    ('early surrender', {'surrender': True}, -0.63),
+    ('blackjack pays 3:2', {'blackjack_payout': 1.5}, -2.27),
+    ('blackjack pays 6:5', {'blackjack_payout': 1.2}, -0.88),
+    ('single deck', {'number_deck': 1}, -0.46),
+    ('two decks', {'number_deck': 2}, -0.17),
+]
+# Known shifts of the effects in this game from the published values, in percent. Split aces
+# are played here like any pair (hit, doubled and resplit), while the published resplit
+# effect gives them one card and never resplits them: with the aces never split, resplitting
+# measures -0.05 like the tables, and resplitting them is worth about 0.06% more.
+KNOWN_GAPS = {'resplit to 4 hands': -0.06}
+
+
+def dealer_policy(obs):
+    """
+    Plays like the dealer: hit below 17, stand otherwise.
+    """
+    return np.where(obs[:, 0] < 17, Actions.HIT.value, Actions.STAND.value)
+
+
+class SimulationResult:
+    """
+    Sums of the gains of the simulated hands, merged chunk after chunk.
+    """
+
+    def __init__(self):
+        self.hands = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.curve = []
+        self.elapsed = 0.0
+
+    def add(self, hands, total, total_sq, curve):
+        self.hands += hands
+        self.total += total
+        self.total_sq += total_sq
+        start = self.curve[-1] if self.curve else 0.0
+        self.curve.extend(start + np.cumsum(curve))
+
+    @property
+    def ev(self):
+        return self.total / self.hands if self.hands else 0.0
+
+    @property
+    def variance(self):
+        return self.total_sq / self.hands - self.ev ** 2 if self.hands else 0.0
+
+    @property
+    def hands_per_second(self):
+        return self.hands / self.elapsed if self.elapsed else 0.0
+
+
+def run_chunk(args):
+    """
+    Plays `rounds` rounds on each of the `num_envs` shoes of a chunk.
+
+    Parameters:
+    - args: (seed sequence of the chunk, policy, rules, num_envs, rounds).
+
+    Returns:
+    - hands, total, total_sq, curve: number of hands, sum and sum of squares of their gains and
+      gain of each round summed over the shoes.
+    """
+    seed, policy, rules, num_envs, rounds = args
+    env = VectorBlackjackEnv(rules.number_deck, num_envs, seed=seed, rules=rules)
+    obs = env.reset()
+    played = np.zeros(num_envs, dtype=np.int64)
+    gain = np.zeros(num_envs, dtype=np.float64)
+    results = np.zeros((rounds, num_envs), dtype=np.float64)
+    while True:
+        playing = played < rounds
+        if not playing.any():
+            break
+        obs, reward, done, _ = env.step(policy(obs))
+        gain += reward
+        # Rows that already played their rounds keep running in lockstep, their hands are not counted
+        done &= playing
+        results[played[done], env.rows[done]] = gain[done]
+        gain[done] = 0
+        played += done
+    return results.size, results.sum(), np.square(results).sum(), results.sum(axis=1)
+
+
+class SimulationRunner:
+    """
+    Splits a number of hands into chunks played by a pool of processes.
+
+    Every chunk gets its own Generator spawned from the master seed and results are
+    merged in chunk order, so a master seed gives the same results whatever the
+    number of workers.
+    """
+
+    def __init__(self, number_deck, policy=dealer_policy, num_envs=1024, rounds_per_chunk=64, seed=None, rules=None):
+        self.rules = rules or RuleSet(number_deck)
+        self.number_deck = self.rules.number_deck
+        self.policy = policy
+        self.num_envs = num_envs
+        self.rounds_per_chunk = rounds_per_chunk
+        self.seed = seed
+
+    def chunks(self, hands):
+        chunk_hands = self.num_envs * self.rounds_per_chunk
+        nb_chunks = -(-hands // chunk_hands)
+        seeds = np.random.SeedSequence(self.seed).spawn(nb_chunks)
+        return [(seed, self.policy, self.rules, self.num_envs, self.rounds_per_chunk) for seed in seeds]
+
+    def stream(self, hands, workers=1):
+        """
+        Runs the simulation and yields the merged result after each chunk.
+
+        Parameters:
+        - hands: number of hands to play, rounded up to a whole number of chunks.
+        - workers: number of processes.
+        """
+        result = SimulationResult()
+        start = time.perf_counter()
+        with Pool(workers) as pool:
+            for chunk in pool.imap(run_chunk, self.chunks(hands)):
+                result.add(*chunk)
+                result.elapsed = time.perf_counter() - start
+                yield result
+
+    def run(self, hands, workers=1):
+        for result in self.stream(hands, workers):
+            pass
+        return result
+
+    def scaling(self, hands, worker_counts):
+        """
+        Measures hands/second and scaling efficiency for each number of workers.
+
+        Returns:
+        - report: list of (workers, hands_per_second, efficiency), the efficiency being
+          relative to one worker (or to the first count given) times the number of workers.
+        """
+        report = []
+        for workers in worker_counts:
+            rate = self.run(hands, workers).hands_per_second
+            base = report[0][1] / report[0][0] if report else rate / workers
+            report.append((workers, rate, rate / (base * workers)))
+        return report
+
+
+def check_rule_effects(hands, workers=1, seed=0, base=RuleSet(), tolerance=0.05, effects=PUBLISHED_RULE_EFFECTS):
+    """
+    Simulates basic strategy under each rule of `effects`, (name, RuleSet changes, published
+    change of house edge) like PUBLISHED_RULE_EFFECTS, and compares the change of house edge
+    with the expected one, the published value shifted by its KNOWN_GAPS.
+
+    Every rule set is played from the same master seed, so its rounds are dealt from the same
+    random numbers as the base ones (see VectorBlackjackEnv), and the change is measured on the
+    paired differences of the gains of each round with the base rules. A rule passes when its
+    change is within three standard errors plus `tolerance` (in percent) of the expected
+    value, the margin left for the base game not being the one of the published tables.
+
+    Returns:
+    - report: list of (name, published, expected, measured, standard error, passed), in percent.
+    """
+    from BasicStrategy import BasicStrategy
+
+    def round_gains(rules):
+        result = SimulationRunner(rules.number_deck, BasicStrategy(rules.number_deck, rules=rules),
+                                  seed=seed, rules=rules).run(hands, workers)
+        return np.diff(result.curve, prepend=0.0), result.hands
+
+    base_gains, _ = round_gains(base)
+    report = []
+    for name, changes, published in effects:
+        gains, played = round_gains(RuleSet(**{**base._asdict(), **changes}))
+        # Gains of the rounds played by the same rows, summed over the rows, house edge in percent
+        difference = base_gains - gains
+        measured = 100 * difference.sum() / played
+        stderr = 100 * difference.std() * np.sqrt(len(difference)) / played
+        expected = published + KNOWN_GAPS.get(name, 0.0)
+        report.append((name, published, expected, measured, stderr,
+                       abs(measured - expected) <= 3 * stderr + tolerance))
+    return report
+
+
+if __name__ == '__main__':
+    import os
+
+    runner = SimulationRunner(6, seed=0)
+    result = runner.run(2_000_000, workers=os.cpu_count())
+    print(f'EV: {result.ev:.5f}, variance: {result.variance:.4f}, {result.hands_per_second:.0f} hands/s')
+    for workers, rate, efficiency in runner.scaling(2_000_000, [1, 2, 4, os.cpu_count()]):
+        print(f'{workers} workers: {rate:.0f} hands/s, efficiency {efficiency:.2f}')
+    for name, published, expected, measured, stderr, passed in check_rule_effects(10_000_000, os.cpu_count()):
+        print(f'{name}: published {published:+.2f}%, expected {expected:+.2f}%, '
+              f'measured {measured:+.2f}% +/- {stderr:.2f}% {"ok" if passed else "FAILED"}')
@@ -0,0 +1,371 @@
+"""
+Asyncio server hosting many blackjack tables for remote human or bot clients.
+
+    python TableServer.py serve [--host 127.0.0.1 --port 8765 | --unix PATH] [--timeout 10]
+    python TableServer.py load --clients 1000 --rounds 20 [--host ... --port ... | --unix PATH]
+
+The protocol is line-delimited JSON over TCP or a Unix socket, one object per line:
+
+    client -> server
+        {"type": "join", "bet": 10}              sit at a table with a free seat ("table": id to choose one),
+                                                 the bet being a positive number up to the table maximum
+        {"type": "action", "action": "hit"}      answer a decision: hit, stand, split, double or surrender
+        {"type": "leave"}                        leave the table after the current round
+        {"type": "stats"}                        decision latency percentiles of the server
+
+    server -> client
+        {"type": "seated", "table": 0, "player": 2}  player: id of the client, stable while it is connected
+        {"type": "decide", "hand": [10, 6], "value": 16, "dealer": 9, "actions": ["hit", "stand", ...]}
+        {"type": "result", "dealer": [9, 7, 10], "dealer_value": 26, "gains": [10]}
+        {"type": "stats", "decisions": 1234, "p50_ms": 0.4, "p99_ms": 2.1, "tables": 3, "clients": 20}
+        {"type": "error", "message": "..."}
+
+Every table runs BlackjackEngine on its own task. A round is dealt to the
+players seated when it starts (those joining during a round wait for the next
+one), and every decision has a timer: a seat that does not answer within
+`timeout` seconds, or whose client is gone, stands, and so does a seat
+answering with an action that is not available. A round that fails is
+abandoned with an error message to its players, the table going on with the
+next one. The server measures the decision latency, from sending `decide` to
+receiving the action. A client that does not read its messages is disconnected
+once MAX_WRITE_BUFFER bytes wait to be sent to it, rather than slowing its table
+down or growing the buffer without bound.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import deque
+
+import HandState
+from BlackjackEngine import Actions, BlackjackEngine
+from RuleSet import RuleSet
+
+ACTION_NAMES = {action.name.lower(): action for action in Actions}
+# Bytes waiting to be sent to a client beyond which it is disconnected
+MAX_WRITE_BUFFER = 1 << 20
+logger = logging.getLogger(__name__)
+
+
+def valid_bet(bet, max_bet):
+    """
+    A bet is a positive int or float (not a bool) up to the table maximum `max_bet`.
+    """
+    return isinstance(bet, (int, float)) and not isinstance(bet, bool) and 0 < bet <= max_bet
+
+
+def percentiles(latencies):
+    """
+    Returns the (p50, p99) of a sequence of latencies in seconds, in milliseconds.
+    """
+    if len(latencies) < 2:
+        value = 1000 * latencies[0] if latencies else 0.0
+        return value, value
+    cuts = statistics.quantiles(latencies, n=100)
+    return 1000 * cuts[49], 1000 * cuts[98]
+
+
+class Client:
+    """
+    Connection of a remote player, seated at most at one table.
+    """
+    __slots__ = ('client_id', 'writer', 'bet', 'table', 'pending', 'closed')
+
+    def __init__(self, client_id, writer):
+        self.client_id = client_id
+        self.writer = writer
+        self.bet = 1
+        self.table = None
+        self.pending = None
+        self.closed = False
+
+    def send(self, message):
+        if self.closed:
+            return
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        # The tables do not wait for a slow client: one that lets its messages pile up is dropped,
+        # its handler then freeing its seat and standing its pending decision
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.closed = True
+            self.writer.transport.abort()
+
+
+class Table:
+    """
+    A table of the server: its engine, its seated clients and the task playing its rounds.
+    """
+
+    def __init__(self, server, table_id):
+        self.server = server
+        self.table_id = table_id
+        self.rules = server.rules
+        self.engine = BlackjackEngine(self.rules, rng=random.Random())
+        self.clients = []
+        self.leaving = set()
+        self.wake = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    @property
+    def full(self):
+        return len(self.clients) >= self.rules.number_seats
+
+    def seat(self, client):
+        self.clients.append(client)
+        client.table = self
+        client.send({'type': 'seated', 'table': self.table_id, 'player': client.client_id})
+        self.wake.set()
+
+    def remove(self, client):
+        """
+        Frees the seat of `client` at the end of the current round.
+        """
+        self.leaving.add(client)
+
+    async def run(self):
+        engine = self.engine
+        while True:
+            if self.leaving:
+                self.clients = [client for client in self.clients if client not in self.leaving]
+                for client in self.leaving:
+                    client.table = None
+                self.leaving.clear()
+            if not self.clients:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            players = list(self.clients)
+            try:
+                await self.play_round(players)
+            except Exception:
+                # A round that fails must not stop the table: its players are told and the next round is dealt
+                logger.exception('table %d: round abandoned', self.table_id)
+                engine.hands = []
+                for client in players:
+                    client.send({'type': 'error', 'message': 'round abandoned'})
+
+    async def play_round(self, players):
+        engine = self.engine
+        engine.deal([client.bet for client in players])
+        while engine.playing:
+            action = await self.decide(players[engine.player])
+            if not engine.apply_action(action):
+                engine.apply_action(Actions.STAND)
+        results = engine.settle_round()
+        gains = [[] for _ in players]
+        for player, _, gain in results:
+            gains[player].append(gain)
+        dealer_value = HandState.value_hands(engine.dealer)
+        for client, client_gains in zip(players, gains):
+            client.send({'type': 'result', 'dealer': engine.dealer, 'dealer_value': dealer_value,
+                         'gains': client_gains})
+
+    async def decide(self, client):
+        """
+        Asks `client` for the action of the hand playing, standing when the timer expires.
+        """
+        if client.closed or client in self.leaving:
+            return Actions.STAND
+        engine = self.engine
+        hand = engine.current_hand()
+        loop = asyncio.get_running_loop()
+        client.pending = future = loop.create_future()
+        client.send({'type': 'decide', 'hand': hand, 'value': HandState.value_hands(hand), 'dealer': engine.dealer[0],
+                     'actions': [action.name.lower() for action in engine.legal_actions()]})
+        timer = loop.call_later(self.server.timeout, _resolve, future, Actions.STAND)
+        start = time.perf_counter()
+        action = await future
+        timer.cancel()
+        client.pending = None
+        self.server.latencies.append(time.perf_counter() - start)
+        return action
+
+
+def _resolve(future, action):
+    if not future.done():
+        future.set_result(action)
+
+
+class TableServer:
+    """
+    Hosts the tables and the client connections on one event loop.
+
+    Parameters:
+    - rules: RuleSet of every table, its number of seats included.
+    - timeout: seconds given to a seat for each decision before it stands.
+    - max_bet: largest bet accepted at the tables.
+    """
+
+    def __init__(self, rules=None, timeout=10.0, max_bet=1000):
+        self.rules = rules or RuleSet()
+        self.timeout = timeout
+        self.max_bet = max_bet
+        self.tables = []
+        self.clients = 0
+        self.next_client_id = 0
+        self.latencies = deque(maxlen=100000)
+
+    def find_table(self, table_id=None):
+        if table_id is not None:
+            if not isinstance(table_id, int) or isinstance(table_id, bool):
+                return None
+            if 0 <= table_id < len(self.tables) and not self.tables[table_id].full:
+                return self.tables[table_id]
+            return None
+        for table in self.tables:
+            if not table.full:
+                return table
+        self.tables.append(Table(self, len(self.tables)))
+        return self.tables[-1]
+
+    def stats(self):
+        p50, p99 = percentiles(self.latencies)
+        return {'type': 'stats', 'decisions': len(self.latencies), 'p50_ms': p50, 'p99_ms': p99,
+                'tables': len(self.tables), 'clients': self.clients}
+
+    async def handle(self, reader, writer):
+        client = Client(self.next_client_id, writer)
+        self.next_client_id += 1
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message['type']
+                except (ValueError, KeyError, TypeError):
+                    client.send({'type': 'error', 'message': 'invalid message'})
+                    continue
+                if kind == 'action':
+                    action = message.get('action')
+                    action = ACTION_NAMES.get(action) if isinstance(action, str) else None
+                    if action is None or client.pending is None:
+                        client.send({'type': 'error', 'message': 'no decision pending or unknown action'})
+                    else:
+                        _resolve(client.pending, action)
+                elif kind == 'join':
+                    bet = message.get('bet', 1)
+                    table_id = message.get('table')
+                    if not valid_bet(bet, self.max_bet):
+                        client.send({'type': 'error',
+                                     'message': f'the bet must be a positive number up to {self.max_bet}'})
+                    elif table_id is not None and (not isinstance(table_id, int) or isinstance(table_id, bool)):
+                        client.send({'type': 'error', 'message': 'the table must be an int'})
+                    elif client.table or (table := self.find_table(table_id)) is None:
+                        client.send({'type': 'error', 'message': 'already seated or table full'})
+                    else:
+                        client.bet = bet
+                        table.seat(client)
+                elif kind == 'leave':
+                    if client.table:
+                        client.table.remove(client)
+                elif kind == 'stats':
+                    client.send(self.stats())
+                else:
+                    client.send({'type': 'error', 'message': f'unknown message type {kind}'})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            client.closed = True
+            self.clients -= 1
+            if client.pending is not None:
+                _resolve(client.pending, Actions.STAND)
+            if client.table:
+                client.table.remove(client)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix=None):
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, unix, backlog=4096)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        async with server:
+            await server.serve_forever()
+
+
+async def open_connection(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def bot_client(host, port, unix, rounds, latencies):
+    """
+    Plays `rounds` rounds hitting below 17, appending the response time of the server
+    (from sending a message to receiving the next decision or result) to `latencies`.
+    """
+    reader, writer = await open_connection(host, port, unix)
+    writer.write(b'{"type": "join", "bet": 1}\n')
+    sent = time.perf_counter()
+    played = 0
+    while played < rounds:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        kind = message['type']
+        if kind == 'decide':
+            latencies.append(time.perf_counter() - sent)
+            action = 'hit' if message['value'] < 17 else 'stand'
+            writer.write(f'{{"type": "action", "action": "{action}"}}\n'.encode())
+            sent = time.perf_counter()
+        elif kind == 'result':
+            played += 1
+    writer.write(b'{"type": "leave"}\n')
+    writer.close()
+
+
+async def load(clients, rounds, host='127.0.0.1', port=8765, unix=None):
+    """
+    Runs `clients` bots at once against a server and prints the decisions per second and the
+    p50/p99 of the server response time seen by the clients and of the decision latency seen
+    by the server.
+    """
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(bot_client(host, port, unix, rounds, latencies) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    p50, p99 = percentiles(latencies)
+    print(f'{clients} clients, {len(latencies)} decisions in {elapsed:.1f}s: {len(latencies) / elapsed:.0f} '
+          f'decisions/s, response p50 {p50:.2f} ms, p99 {p99:.2f} ms')
+    reader, writer = await open_connection(host, port, unix)
+    writer.write(b'{"type": "stats"}\n')
+    stats = json.loads(await reader.readline())
+    writer.close()
+    print(f'server: {stats["decisions"]} decisions, latency p50 {stats["p50_ms"]:.2f} ms, '
+          f'p99 {stats["p99_ms"]:.2f} ms, {stats["tables"]} tables')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['serve', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='path of a Unix socket, used instead of TCP')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per decision before standing')
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--max-bet', type=float, default=1000, help='largest bet accepted at the tables')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        server = TableServer(RuleSet(args.decks), args.timeout, args.max_bet)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        finally:
+            if args.unix and os.path.exists(args.unix):
+                os.remove(args.unix)
+    else:
+        asyncio.run(load(args.clients, args.rounds, args.host, args.port, args.unix))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,393 @@
+import numpy as np
+
+import HandState
+import Observation
+import Counting
+from BlackjackEngine import Actions
+from RuleSet import RuleSet
+
+CARDS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11]
+NEXT = np.array(HandState.NEXT, dtype=np.int16)
+TOTAL = np.array(HandState.TOTAL, dtype=np.int16)
+SOFT = np.array(HandState.SOFT, dtype=np.int16)
+CARD_VALUES = np.array(CARDS, dtype=np.int16)
+BLACKJACK = np.array(HandState.BLACKJACK, dtype=bool)
+DEALER_HITS = np.array(HandState.DEALER_HITS, dtype=bool)
+# Random numbers drawn per row for each round: the player's cards from the first one, the
+# dealer's third card on from DEALER_NUMBERS (a longer round wraps around)
+ROUND_NUMBERS = 64
+DEALER_NUMBERS = 48
+# Constants of the splitmix64 generator of the shoes
+GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def splitmix64(states):
+    """
+    Uniform numbers in [0, 1) from uint64 states, by the output function of splitmix64.
+    """
+    z = (states ^ (states >> np.uint64(30))) * MIX_1
+    z = (z ^ (z >> np.uint64(27))) * MIX_2
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)) * 2.0 ** -53
+
+# TAGS[card] holds the tag of the card in each system of Counting.SYSTEMS, in that order
+SYSTEMS = list(Counting.SYSTEMS)
+TAGS = np.array([Counting.SYSTEMS[system] for system in SYSTEMS], dtype=np.int32).T
+
+
+class VectorBlackjackEnv:
+    """
+    Runs `num_envs` independent shoes in lockstep, one seat per shoe.
+
+    Every shoe is a row of `self.counts`, the cards left per card value, with
+    its own cursor (the number of cards dealt), and every step applies the
+    actions of all the rows with masked array operations. The rules are the
+    RuleSet ones, played like BlackjackEngine: a split hand receives a card
+    straight away and goes to a free hand slot of the row, a hand ends when it
+    reaches 21 or busts and a natural blackjack stands whatever the action.
+    Invalid splits, doubles and surrenders leave the hand as it is and give a
+    reward of -1, like an invalid split in BlackjackEnv.
+
+    Finished rows are dealt a new round straight away, so `step` can be called
+    in a loop without resetting. With `infinite`, the cards are drawn from the
+    rank probabilities instead of the shoes, which leaves nothing to count.
+
+    A card is drawn from the shoe by inverse transform: a uniform number picks a
+    card among the undealt ones sorted by value. The numbers come from a
+    counter-based generator (splitmix64) keyed per row from `seed` and indexed
+    by the round of the row and the card in the round, the dealer's draws having
+    their own numbers. Two environments built with the same seed therefore deal
+    the i-th round of a row from the same numbers whatever happened before or in
+    the other rows, so they deal the same cards as long as their shoes hold the
+    same cards, and nearly the same otherwise. This pairs the simulations of
+    two rule sets (common random numbers), whose difference is much less noisy
+    than their results.
+
+    With `counting`, every row also keeps the running count of each system of
+    Counting.SYSTEMS (`running`), updated on each card drawn.
+    `bet_policy(env, rows)`, such as a Counting.BetSpread, then sizes the bet of
+    each round before it is dealt.
+
+    The environment follows the interface of gym.Env without subclassing it:
+    gym is only imported, through GymAdapter, when `action_space` or
+    `observation_space` is first read, so the simulation workers never load it.
+    """
+
+    def __init__(self, number_deck, num_envs, seed=None, rules=None, infinite=False, counting=False,
+                 bet_policy=None):
+        if infinite and counting:
+            raise ValueError('an infinite deck cannot be counted, counting needs the shoes')
+        self.rules = rules or RuleSet(number_deck)
+        self.number_deck = number_deck = self.rules.number_deck
+        self.num_envs = num_envs
+        self.len_deck = 13 * 4 * number_deck
+        self.cut_card = int(self.len_deck * self.rules.penetration)
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(num_envs)
+        full_counts = [(CARDS * 4 * number_deck).count(card) for card in range(12)]
+        self.full_counts = np.array(full_counts, dtype=np.int32)
+        self.counts = np.tile(self.full_counts, (num_envs, 1))
+        # Cards left per card value when the current round of each row was dealt
+        self.round_counts = self.counts.copy()
+        self.cursor = np.full(num_envs, self.len_deck, dtype=np.int32)
+        # Key of the random stream of each row, position of its round in the stream and index of
+        # the next number of the round
+        self.row_keys = self.rng.integers(0, 2 ** 63, num_envs, dtype=np.uint64)
+        self.round_start = np.zeros(num_envs, dtype=np.uint64)
+        self.number_index = np.zeros(num_envs, dtype=np.uint64)
+        # Rule dependent paths, chosen once
+        self.dealer_hits = DEALER_HITS[int(self.rules.hit_soft_17)]
+        self.draw = self.draw_infinite if infinite else self.draw_counted if counting else self.draw_shoes
+        self.counting = counting
+        self.bet_policy = bet_policy
+        # Number of shoes shuffled, the first shuffle of each row included
+        self.shoes_played = 0
+        if counting:
+            self.initial_running = np.array([Counting.initial_count(system, number_deck) for system in SYSTEMS],
+                                            dtype=np.int32)
+            self.running = np.tile(self.initial_running, (num_envs, 1))
+        self.can_double = self.can_double_any if self.rules.double_after_split else self.can_double_before_split
+        # One hand slot per possible hand of a seat, the slots after the first are filled by splits
+        max_hands = self.rules.max_hands
+        self.hand_state = np.zeros((num_envs, max_hands), dtype=np.int16)
+        self.hand_first = np.zeros((num_envs, max_hands), dtype=np.int16)
+        self.hand_pair = np.zeros((num_envs, max_hands), dtype=bool)
+        self.bet = np.zeros((num_envs, max_hands), dtype=np.float32)
+        # Bet placed on the round of each row when it was dealt, before any double or split
+        self.initial_bet = np.zeros(num_envs, dtype=np.float32)
+        self.nb_hands = np.ones(num_envs, dtype=np.int16)
+        self.hand_playing = np.zeros(num_envs, dtype=np.int16)
+        self.surrendered = np.zeros(num_envs, dtype=bool)
+        self.dealer_state = np.zeros(num_envs, dtype=np.int16)
+        self.dealer_card = np.zeros(num_envs, dtype=np.int16)
+        self._action_space = None
+        self._observation_space = None
+        # One row of Observation per shoe, reused by every step
+        self.obs = np.zeros((num_envs, Observation.BASE_SIZE), dtype=np.int16)
+
+    @property
+    def action_space(self):
+        if self._action_space is None:
+            from GymAdapter import spaces
+            self._action_space = spaces.MultiDiscrete([len(Actions)] * self.num_envs)
+        return self._action_space
+
+    @property
+    def observation_space(self):
+        if self._observation_space is None:
+            from GymAdapter import spaces
+            low, high = Observation.bounds(self.number_deck)
+            self._observation_space = spaces.Box(low=np.tile(low, (self.num_envs, 1)),
+                                                 high=np.tile(high, (self.num_envs, 1)), dtype=np.int16)
+        return self._observation_space
+
+    def reset(self):
+        """
+        Shuffles every shoe and deals a new round on every row.
+
+        Returns:
+        - observation: array of shape (num_envs, Observation.BASE_SIZE), one observation per row.
+        """
+        self.cursor[:] = self.len_deck
+        self.deal_rounds(self.rows)
+        return self._get_obs()
+
+    def _get_obs(self):
+        state = self.hand_state[self.rows, self.hand_playing]
+        self.obs[:, Observation.PLAYER_TOTAL] = TOTAL[state]
+        self.obs[:, Observation.SOFT] = SOFT[state]
+        self.obs[:, Observation.DEALER_CARD] = self.dealer_card
+        self.obs[:, Observation.CAN_SPLIT] = self.can_split(state, self.hand_pair[self.rows, self.hand_playing])
+        self.obs[:, Observation.CAN_DOUBLE] = self.can_double(state)
+        self.obs[:, Observation.CAN_SURRENDER] = self.can_surrender(state)
+        return self.obs
+
+    def can_split(self, state, pair):
+        return pair & (self.nb_hands <= self.rules.max_splits)
+
+    def can_double_any(self, state):
+        return state % 4 == 2
+
+    def can_double_before_split(self, state):
+        return (state % 4 == 2) & (self.nb_hands == 1)
+
+    def can_surrender(self, state):
+        return (state % 4 == 2) & (self.nb_hands == 1) & self.rules.surrender
+
+    def shuffle_shoes(self, rows):
+        """
+        Shuffles the shoes of `rows` whose cut card has been reached.
+
+        The shuffle only puts the cards back: `draw_shoes` draws each card
+        uniformly among the undealt ones.
+        """
+        rows = rows[self.cursor[rows] > self.cut_card]
+        self.shoes_played += len(rows)
+        self.refill_shoes(rows)
+
+    def refill_shoes(self, rows):
+        """
+        Puts back every card of the shoes of `rows`, without counting a new shoe.
+        """
+        self.cursor[rows] = 0
+        self.counts[rows] = self.full_counts
+        if self.counting:
+            self.running[rows] = self.initial_running
+
+    def shuffle_discards(self, rows):
+        """
+        Shuffles the discards back in the shoes of `rows`, which ran out during a round, as in
+        Shoe.shuffle_discards: the cards of the round stay dealt, and are the only ones counted.
+        """
+        in_play = self.round_counts[rows] - self.counts[rows]
+        self.counts[rows] = self.round_counts[rows] = self.full_counts - in_play
+        self.cursor[rows] = in_play.sum(axis=1)
+        if self.counting:
+            self.running[rows] = self.initial_running + in_play @ TAGS
+
+    def draw_shoes(self, rows):
+        """
+        Draws a card from the shoe of each row in `rows`, uniformly among its undealt cards.
+        """
+        cursor = self.cursor[rows]
+        empty = cursor == self.len_deck
+        if empty.any():
+            # A shoe ran out during a round
+            self.shuffle_discards(rows[empty])
+            cursor = self.cursor[rows]
+        index = self.number_index[rows]
+        self.number_index[rows] = index + np.uint64(1)
+        uniforms = splitmix64(self.row_keys[rows] + (self.round_start[rows] + index % ROUND_NUMBERS) * GAMMA)
+        # Inverse transform: the card of rank `target` among the undealt cards sorted by value
+        target = (uniforms * (self.len_deck - cursor)).astype(np.int32)
+        cumulative = np.cumsum(self.counts[rows, 2:], axis=1, dtype=np.int32)
+        cards = (cumulative <= target[:, None]).sum(axis=1, dtype=np.int16) + 2
+        self.counts[rows, cards] -= 1
+        self.cursor[rows] = cursor + 1
+        return cards
+
+    def draw_counted(self, rows):
+        """
+        Draws like `draw_shoes` and updates the running counts of the rows with the cards drawn.
+        """
+        cards = self.draw_shoes(rows)
+        self.running[rows] += TAGS[cards]
+        return cards
+
+    def betting_counts(self, rows, system='hi_lo'):
+        """
+        Count of each row used to size the bets: the true count of a balanced system, truncated,
+        and the running count of an unbalanced one.
+        """
+        running = self.running[rows, SYSTEMS.index(system)]
+        if not Counting.BALANCED[system]:
+            return running
+        decks_left = np.maximum((self.len_deck - self.cursor[rows]) / 52, 0.5)
+        return np.trunc(running / decks_left).astype(np.int32)
+
+    def draw_infinite(self, rows):
+        """
+        Draws a card for each row in `rows` from the rank probabilities of an infinite deck.
+        """
+        return CARD_VALUES[self.rng.integers(0, len(CARDS), len(rows))]
+
+    def hit_hands(self, rows, hands):
+        """
+        Draws a card into the hand `hands[i]` of each row `rows[i]`.
+        """
+        cards = self.draw(rows)
+        state = self.hand_state[rows, hands]
+        self.hand_pair[rows, hands] = (state % 4 == 1) & (self.hand_first[rows, hands] == cards)
+        self.hand_state[rows, hands] = NEXT[state, cards]
+
+    def start_hands(self, rows, hands, cards):
+        """
+        Replaces the hand `hands[i]` of each row `rows[i]` by a single card.
+        """
+        self.hand_state[rows, hands] = NEXT[HandState.EMPTY_HAND, cards]
+        self.hand_first[rows, hands] = cards
+        self.hand_pair[rows, hands] = False
+
+    def deal_rounds(self, rows):
+        """
+        Starts a new round on `rows`: dealer and player get two cards each, dealer first.
+        """
+        self.shuffle_shoes(rows)
+        self.round_counts[rows] = self.counts[rows]
+        self.round_start[rows] += np.uint64(ROUND_NUMBERS)
+        self.number_index[rows] = 0
+        # The bets are placed before the cards of the round come out of the shoe
+        bets = 1 if self.bet_policy is None else self.bet_policy(self, rows)
+        first = np.zeros(len(rows), dtype=np.int16)
+        self.dealer_card[rows] = self.draw(rows)
+        self.start_hands(rows, first, self.draw(rows))
+        self.dealer_state[rows] = NEXT[NEXT[HandState.EMPTY_HAND, self.dealer_card[rows]], self.draw(rows)]
+        self.hit_hands(rows, first)
+        self.hand_state[rows, 1:] = HandState.EMPTY_HAND
+        self.bet[rows] = 0
+        self.bet[rows, 0] = bets
+        self.initial_bet[rows] = bets
+        self.nb_hands[rows] = 1
+        self.hand_playing[rows] = 0
+        self.surrendered[rows] = False
+
+    def play_dealer_hands(self, rows):
+        """
+        Plays the dealer's hand of `rows` according to the rules, all rows at once.
+        """
+        self.number_index[rows] = DEALER_NUMBERS
+        while True:
+            rows = rows[self.dealer_hits[self.dealer_state[rows]]]
+            if not len(rows):
+                break
+            self.dealer_state[rows] = NEXT[self.dealer_state[rows], self.draw(rows)]
+
+    def settle(self, rows):
+        """
+        Computes the gain of `rows` against the dealer, over every hand of the row.
+        """
+        dealer_state = self.dealer_state[rows]
+        dealer_value = TOTAL[dealer_state, None]
+        player_value = TOTAL[self.hand_state[rows]]
+        bet = self.bet[rows]
+        win = (player_value <= 21) & ((dealer_value > 21) | (player_value > dealer_value))
+        lose = (player_value > 21) | ((dealer_value <= 21) & (player_value < dealer_value))
+        gain = (bet * (win.astype(np.float32) - lose)).sum(axis=1)
+        # Without peek, a dealer blackjack takes every bet except a player blackjack
+        dealer_blackjack = BLACKJACK[dealer_state]
+        blackjack = BLACKJACK[self.hand_state[rows, 0]] & (self.nb_hands[rows] == 1)
+        gain[dealer_blackjack] = -bet[dealer_blackjack].sum(axis=1)
+        gain[blackjack] = np.where(dealer_blackjack[blackjack], 0, self.rules.blackjack_payout * bet[blackjack, 0])
+        # Early surrender: settled last, so it also holds against a dealer blackjack
+        surrendered = self.surrendered[rows]
+        gain[surrendered] = -bet[surrendered, 0] / 2
+        return gain
+
+    def step(self, actions):
+        """
+        Applies one action per row and returns the results of every row.
+
+        Parameters:
+        - actions: array of shape (num_envs,) with one Actions value per row.
+
+        Returns:
+        - observation: the state after the actions (the new round for finished rows)
+        - reward: gain of the rows whose round is over, -1 for an invalid action, 0 otherwise
+        - done: indicates the rows whose round is over
+        - truncated: always False
+        """
+        actions = np.asarray(actions)
+        rows = self.rows
+        hands = self.hand_playing
+        reward = np.zeros(self.num_envs, dtype=np.float32)
+
+        state = self.hand_state[rows, hands]
+        # A natural blackjack is over whatever the action
+        blackjack = BLACKJACK[state] & (self.nb_hands == 1)
+        hit = (actions == Actions.HIT.value) & ~blackjack
+        stand = (actions == Actions.STAND.value) | blackjack
+        split = (actions == Actions.SPLIT.value) & ~blackjack
+        double = (actions == Actions.DOUBLE.value) & ~blackjack
+        surrender = (actions == Actions.SURRENDER.value) & ~blackjack
+        can_split = self.can_split(state, self.hand_pair[rows, hands])
+        can_double = self.can_double(state)
+        can_surrender = self.can_surrender(state)
+        reward[(split & ~can_split) | (double & ~can_double) | (surrender & ~can_surrender)] = -1
+        split &= can_split
+        double &= can_double
+        surrender &= can_surrender
+        self.surrendered |= surrender
+
+        drawn = hit | double
+        if drawn.any():
+            self.hit_hands(rows[drawn], hands[drawn])
+            self.bet[rows[double], hands[double]] *= 2
+
+        if split.any():
+            # The hand keeps its first card and the second one starts the next free slot
+            split_rows = rows[split]
+            split_hands = hands[split]
+            new_hands = self.nb_hands[split_rows]
+            cards = self.hand_first[split_rows, split_hands]
+            self.start_hands(split_rows, split_hands, cards)
+            self.start_hands(split_rows, new_hands, cards)
+            self.hit_hands(split_rows, split_hands)
+            self.hit_hands(split_rows, new_hands)
+            self.bet[split_rows, new_hands] = self.bet[split_rows, split_hands]
+            self.nb_hands[split_rows] += 1
+
+        # Move to the next hand of the row or to the dealer
+        finished = stand | double | surrender | (hit & (TOTAL[self.hand_state[rows, hands]] >= 21))
+        next_hand = finished & (hands + 1 < self.nb_hands)
+        self.hand_playing[next_hand] += 1
+        done = finished & ~next_hand
+
+        if done.any():
+            done_rows = rows[done]
+            self.play_dealer_hands(done_rows)
+            reward[done_rows] += self.settle(done_rows)
+            self.deal_rounds(done_rows)
+
+        return self._get_obs(), reward, done, np.zeros(self.num_envs, dtype=bool)
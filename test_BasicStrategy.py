@@ -0,0 +1,26 @@
+from BasicStrategy import MAX_TRUE_COUNT, MIN_TRUE_COUNT, shoe_counts
+from DealerProbabilities import RANKS, DealerProbabilities
+
+
+def recorded_draws(engine, probabilities):
+    draws = engine._draws
+
+    def record(counts):
+        for card, probability, remaining in draws(counts):
+            probabilities.append(probability)
+            yield card, probability, remaining
+    return record
+
+
+def test_draws_of_the_count_tables_are_probabilities():
+    for number_deck in (1, 2, 4, 6, 8):
+        engine = DealerProbabilities(number_deck)
+        probabilities = []
+        engine._draws = recorded_draws(engine, probabilities)
+        for true_count in range(MIN_TRUE_COUNT, MAX_TRUE_COUNT + 1):
+            counts = shoe_counts(number_deck, true_count)
+            assert min(counts) >= 0
+            for upcard in RANKS:
+                outcomes = engine.dealer_outcomes(upcard, counts)
+                assert abs(sum(outcomes) - 1) < 1e-9
+        assert all(0 <= p <= 1 for p in probabilities), number_deck
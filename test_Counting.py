@@ -0,0 +1,16 @@
+import numpy as np
+
+import Observation
+from BlackjackEngine import Actions
+from Counting import BetSpread, simulate_bet_spread
+from RuleSet import RuleSet
+
+
+def split_and_double(obs):
+    return np.where(obs[:, Observation.CAN_SPLIT], Actions.SPLIT.value, Actions.DOUBLE.value)
+
+
+def test_average_bet_is_the_wager_placed_at_the_deal():
+    result = simulate_bet_spread(BetSpread((3,)), RuleSet(6), shoes=2000, num_envs=64, seed=0,
+                                 policy=split_and_double)
+    assert result['average_bet'] == 3
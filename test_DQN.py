@@ -0,0 +1,10 @@
+from DQN import DQN, legal_actions
+
+
+def test_actions_are_legal_greedy_and_exploring():
+    agent = DQN(num_envs=64, capacity=10_000, batch_size=64, seed=0)
+    agent.train(20, log_every=0)
+    obs = agent.obs
+    for epsilon in (0.0, 1.0):
+        actions = agent.act(obs, epsilon)
+        assert legal_actions(obs)[range(len(obs)), actions].all()
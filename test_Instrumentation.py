@@ -0,0 +1,17 @@
+import random
+
+from BlackjackEngine import BlackjackEngine, play_rounds
+from Instrumentation import Instruments
+from RuleSet import RuleSet
+
+
+def test_phases_are_recorded_again_after_a_reset():
+    instruments = Instruments()
+    engine = BlackjackEngine(RuleSet(6, number_seats=1), rng=random.Random(0), instruments=instruments)
+    play_rounds(engine, 10, [10])
+    instruments.reset()
+    assert instruments.timers['deal'][0] == 0
+    play_rounds(engine, 10, [10])
+    assert instruments.timers['deal'][0] == 10
+    assert sum(instruments.actions.values()) > 0
+    assert 'phase="deal"} 10' in instruments.prometheus()
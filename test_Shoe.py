@@ -0,0 +1,34 @@
+import random
+
+from Counting import HI_LO, CountingShoe
+from Shoe import InfiniteShoe
+
+
+def test_infinite_shoe_cursor_counts_the_cards_dealt():
+    shoe = InfiniteShoe(1, rng=random.Random(0))
+    for _ in range(10):
+        shoe.draw()
+    assert shoe.cursor == 10 and len(shoe) == shoe.len_deck - 10
+    shoe.shuffle()
+    assert shoe.cursor == 0
+
+
+def test_infinite_shoe_cursor_wraps_around_after_a_shoe():
+    shoe = InfiniteShoe(1, rng=random.Random(0))
+    for _ in range(shoe.len_deck + 3):
+        shoe.draw()
+    assert shoe.cursor == 3
+
+
+def test_cards_of_the_round_stay_dealt_when_the_shoe_runs_out():
+    shoe = CountingShoe(1, rng=random.Random(0))
+    for _ in range(40):
+        shoe.draw()
+    shoe.start_round()
+    in_play = [shoe.draw() for _ in range(12)]
+    drawn = shoe.draw()
+    assert shoe.cursor == 13
+    assert sum(shoe.full_counts) - sum(shoe.counts) == 13
+    dealt = in_play + [drawn]
+    assert shoe.counts == [shoe.full_counts[card] - dealt.count(card) for card in range(12)]
+    assert shoe.running['hi_lo'] == sum(HI_LO[card] for card in dealt)
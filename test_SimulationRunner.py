@@ -0,0 +1,24 @@
+import pytest
+
+from SimulationRunner import PUBLISHED_RULE_EFFECTS, check_rule_effects
+
+# Hands per rule set and largest error on each change of house edge, in percent: about three
+# standard errors at that number of hands, and below the distance to the wrong values the
+# check has to catch (early surrender at -0.45, two decks at -0.06). The deck counts change
+# the cards dealt and pair worse, so they need more hands.
+CASES = [
+    (1_000_000, {'dealer hits soft 17': 0.08, 'no double after split': 0.06, 'resplit to 4 hands': 0.05,
+                 'early surrender': 0.12, 'blackjack pays 3:2': 0.04, 'blackjack pays 6:5': 0.03}),
+    (3_000_000, {'single deck': 0.12, 'two decks': 0.08}),
+]
+
+
+def test_every_effect_is_checked():
+    assert {name for _, tolerances in CASES for name in tolerances} == {name for name, _, _ in PUBLISHED_RULE_EFFECTS}
+
+
+@pytest.mark.parametrize('hands, tolerances', CASES)
+def test_rule_effects_match_published_values(hands, tolerances):
+    effects = [effect for effect in PUBLISHED_RULE_EFFECTS if effect[0] in tolerances]
+    for name, _, expected, measured, stderr, _ in check_rule_effects(hands, seed=0, effects=effects):
+        assert abs(measured - expected) <= tolerances[name], (name, measured, stderr)
@@ -0,0 +1,8 @@
+from TableServer import valid_bet
+
+
+def test_bets_above_the_table_maximum_are_rejected():
+    assert valid_bet(1000, 1000) and valid_bet(0.5, 1000)
+    assert not valid_bet(1e308, 1000)
+    assert not valid_bet(float('inf'), 1000)
+    assert not valid_bet(0, 1000) and not valid_bet(True, 1000) and not valid_bet('10', 1000)
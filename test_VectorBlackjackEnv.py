@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import Observation
+from BlackjackEngine import Actions
+from RuleSet import RuleSet
+from VectorBlackjackEnv import TAGS, VectorBlackjackEnv
+
+
+def hit_steps(env, steps):
+    env.reset()
+    actions = np.full(env.num_envs, Actions.HIT.value)
+    for _ in range(steps):
+        env.step(actions)
+
+
+def test_shoe_running_out_during_a_round_is_shuffled_back():
+    env = VectorBlackjackEnv(1, 64, seed=0, rules=RuleSet(1, penetration=0.95))
+    hit_steps(env, 2000)
+    assert (env.cursor <= env.len_deck).all()
+
+
+def test_counts_follow_a_shoe_shuffled_back():
+    env = VectorBlackjackEnv(1, 64, seed=0, rules=RuleSet(1, penetration=0.95), counting=True)
+    hit_steps(env, 2000)
+    dealt = env.full_counts - env.counts
+    assert (env.counts >= 0).all()
+    assert (dealt.sum(axis=1) == env.cursor).all()
+    assert (env.running == env.initial_running + dealt @ TAGS).all()
+
+
+def test_cards_of_the_round_stay_dealt_when_the_shoe_runs_out():
+    env = VectorBlackjackEnv(1, 1, seed=0, rules=RuleSet(1, penetration=0.95))
+    env.reset()
+    for _ in range(2000):
+        cursor = env.cursor[0]
+        _, _, done, _ = env.step(np.array([Actions.HIT.value]))
+        # A hit that ran out of cards, the round going on
+        if not done[0] and env.cursor[0] < cursor:
+            break
+    else:
+        raise AssertionError('the shoe never ran out during a round')
+    # Two cards of the dealer and two of the player at least were on the table
+    assert env.cursor[0] >= 5
+    assert (env.full_counts - env.counts).sum() == env.cursor[0]
+
+
+def test_same_seed_deals_the_same_cards_under_other_rules():
+    envs = [VectorBlackjackEnv(6, 64, seed=0, rules=RuleSet(6, surrender=surrender)) for surrender in (False, True)]
+    observations = [env.reset()[:, :Observation.CAN_SURRENDER] for env in envs]
+    assert (observations[0] == observations[1]).all()
+    assert (envs[0].counts == envs[1].counts).all()
+
+
+def test_infinite_deck_cannot_be_counted():
+    with pytest.raises(ValueError):
+        VectorBlackjackEnv(6, 4, infinite=True, counting=True)
+
+
+def test_large_shoes_draw_valid_cards():
+    env = VectorBlackjackEnv(1000, 64, seed=0)
+    hit_steps(env, 50)
+    dealt = env.full_counts - env.counts
+    assert (env.counts >= 0).all() and (dealt[:, :2] == 0).all()
+    assert (dealt.sum(axis=1) == env.cursor).all()